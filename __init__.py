@@ -2,16 +2,58 @@
 # __init__.py
 import logging
 import asyncio
-from .battery_soc_collection import init_database, collect_soc_data
-from .sensors.average_battery_usage import AverageBatteryUsageSensor
+from .battery_soc_collection import SocCapture
+from .soc_archive import SocArchive, get_archive_directory
+from .soc_database import SocDataWriter, SocReadPool, get_database_path, init_database
+from .soc_retention import SocRetentionJob
+from .soc_history import SocHistory, load_soc_history
+from .soc_backfill import async_run_backfill
+from .soc_aggregators import SocAggregators
+from .soc_profile import SocProfileStore
+from .soc_regression import SocRegressions
+from .sensors.average_battery_usage import (
+    AverageBatteryUsageSensor,
+    async_update_usage_sensors,
+)
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.const import EVENT_HOMEASSISTANT_STARTED
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
 from homeassistant.helpers.event import async_track_time_interval
-from .const import DOMAIN, set_api_key_and_account, unique_id_lookback
-from .octopus_api import get_octopus_energy_rates
-from .get_tariff import get_tariff
+from .const import (
+    DOMAIN,
+    CONF_HISTORY_BACKEND,
+    CONF_RAW_RETENTION_DAYS,
+    CONF_SOC_DEADBAND,
+    CONF_SOC_FLUSH_MINUTES,
+    CONF_SOC_FLUSH_SAMPLES,
+    CONF_SOC_HEARTBEAT_MINUTES,
+    CONF_SOC_STORAGE_MODE,
+    CONF_SOC_SYNCHRONOUS,
+    CONF_TARIFF_CACHE_HOURS,
+    DEFAULT_HISTORY_BACKEND,
+    DEFAULT_RAW_RETENTION_DAYS,
+    DEFAULT_SOC_DEADBAND,
+    DEFAULT_SOC_FLUSH_MINUTES,
+    DEFAULT_SOC_FLUSH_SAMPLES,
+    DEFAULT_SOC_HEARTBEAT_MINUTES,
+    DEFAULT_SOC_STORAGE_MODE,
+    DEFAULT_SOC_SYNCHRONOUS,
+    DEFAULT_TARIFF_CACHE_HOURS,
+    HISTORY_BACKEND_ARCHIVE,
+    STORAGE_MODE_CHANGE,
+    set_api_key_and_account,
+    unique_id_lookback,
+)
+from .octopus_api import (
+    RatesStore,
+    fetch_unit_rates,
+    rates_are_stale,
+    store_rate_views,
+)
+from .octopus_client import create_octopus_client, get_octopus_client
+from .get_tariff import TariffCache, get_tariff_cache
 from .charging_control import ChargingControl
 from homeassistant.const import EVENT_STATE_CHANGED
 from datetime import datetime, time, timedelta
@@ -23,7 +65,6 @@ from homeassistant.helpers.event import async_call_later
 _LOGGER = logging.getLogger(__name__)
 
 SOC_DATA = {}  # Dictionary to store SoC data
-MAX_DATA_AGE = timedelta(days=7)  # Maximum age of data to keep
 
 
 def set_charging_control_enabled(hass: HomeAssistant, value: bool):
@@ -92,21 +133,134 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     # Store API key and Account ID for global access
     set_api_key_and_account(api_key, account_id)
 
-    # Start tariff fetching as a background task
-    hass.async_create_task(get_tariff_background(api_key, account_id, hass))
+    # One client on HA's shared session for all Octopus requests
+    hass.data[DOMAIN]["octopus_client"] = create_octopus_client(hass, api_key)
+
+    # Tariff agreements survive restarts, rate refreshes skip the account call
+    tariff_cache = TariffCache(
+        hass,
+        timedelta(
+            hours=entry.data.get(CONF_TARIFF_CACHE_HOURS, DEFAULT_TARIFF_CACHE_HOURS)
+        ),
+    )
+    await tariff_cache.async_load()
+    hass.data[DOMAIN]["tariff_cache"] = tariff_cache
+
+    # Saved rates give every entity data straight away, the network fetch
+    # only follows when newer rates have been published since
+    rates_store = RatesStore(hass)
+    hass.data[DOMAIN]["rates_store"] = rates_store
+    hass.data[DOMAIN]["rates_data"] = {}
+    # Only one rates fetch runs at a time
+    hass.data[DOMAIN]["rates_lock"] = asyncio.Lock()
+    rates_import, fetched_at = await rates_store.async_load()
+    # The raw rates rebuild the date views each half hour, through midnight
+    hass.data[DOMAIN]["rates_raw"] = rates_import
+    if rates_import is not None:
+        hass.data[DOMAIN]["rates_data"].update(store_rate_views(rates_import))
+        hass.data[DOMAIN]["rates_data"]["last_update"] = fetched_at
+    if rates_import is None or rates_are_stale(fetched_at):
+        track_rate_task(hass, get_tariff_background(api_key, account_id, hass))
 
     await wait_for_valid_state(hass, battery_charge_entity_id)
     await wait_for_valid_state(hass, battery_capacity_entity_id)
     # Call the setup_scheduled_updates at the end of async_setup_entry
     setup_scheduled_updates(hass)
-    # Initialize the database
-    init_database(hass)
+    storage_mode = entry.data.get(CONF_SOC_STORAGE_MODE, DEFAULT_SOC_STORAGE_MODE)
+    hass.data[DOMAIN]["soc_storage_mode"] = storage_mode
+
+    # Initialize the database and start the long-lived SoC writer
+    await hass.async_add_executor_job(init_database, hass)
+    soc_archive = None
+    if entry.data.get(CONF_HISTORY_BACKEND, DEFAULT_HISTORY_BACKEND) == (
+        HISTORY_BACKEND_ARCHIVE
+    ):
+        soc_archive = SocArchive(get_archive_directory(hass))
+    hass.data[DOMAIN]["soc_archive"] = soc_archive
+    # Buffered samples are committed together to spare SD cards an fsync each
+    flush_minutes = entry.data.get(CONF_SOC_FLUSH_MINUTES, DEFAULT_SOC_FLUSH_MINUTES)
+    soc_writer = SocDataWriter(
+        get_database_path(hass),
+        soc_archive,
+        flush_interval=flush_minutes * 60,
+        flush_samples=entry.data.get(CONF_SOC_FLUSH_SAMPLES, DEFAULT_SOC_FLUSH_SAMPLES)
+        if flush_minutes
+        else 1,
+        synchronous=entry.data.get(CONF_SOC_SYNCHRONOUS, DEFAULT_SOC_SYNCHRONOUS),
+    )
+    soc_writer.start()
+    hass.data[DOMAIN]["soc_writer"] = soc_writer
+    if soc_archive is not None:
+        # A new archive starts with the raw samples already in SQLite
+        soc_writer.submit(soc_archive.import_database)
+
+    # Pooled read-only connections for the calculations on executor threads
+    soc_read_pool = SocReadPool(get_database_path(hass))
+    hass.data[DOMAIN]["soc_read_pool"] = soc_read_pool
+
+    async def close_soc_writer(event):
+        await hass.async_add_executor_job(soc_writer.close)
+        soc_read_pool.close()
+
+    entry.async_on_unload(
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, close_soc_writer)
+    )
+
+    # Preload the in-memory history every calculation reads from
+    soc_history = SocHistory()
+    if soc_archive is not None:
+        # Wait for the archive seed so the history loads from a complete archive
+        await hass.async_add_executor_job(soc_writer.flush)
+    await hass.async_add_executor_job(load_soc_history, hass, soc_history)
+    hass.data[DOMAIN]["soc_history"] = soc_history
+
+    # Rolling-window totals for the usage sensors, resumed from their checkpoint
+    soc_aggregators = SocAggregators(
+        hass, soc_history, storage_mode == STORAGE_MODE_CHANGE
+    )
+    await soc_aggregators.async_load()
+    hass.data[DOMAIN]["soc_aggregators"] = soc_aggregators
+
+    # Hour-of-week usage profile for the profile predictor
+    soc_profile = SocProfileStore(hass)
+    await soc_profile.async_load()
+    hass.data[DOMAIN]["soc_profile"] = soc_profile
+
+    # Streaming trend lines, seeded from the history per lookback on first use
+    hass.data[DOMAIN]["soc_regressions"] = SocRegressions(soc_history)
 
-    # Schedule the collect_soc_data function to run every 10 minutes
-    async def interval_callback(now):
-        await collect_soc_data(hass)
+    # Roll up and prune the SoC history off the event loop once an hour
+    raw_retention = timedelta(
+        days=entry.data.get(CONF_RAW_RETENTION_DAYS, DEFAULT_RAW_RETENTION_DAYS)
+    )
+
+    def run_retention(now=None):
+        soc_writer.submit(SocRetentionJob(raw_retention, archive=soc_archive))
 
-    async_track_time_interval(hass, interval_callback, timedelta(minutes=1))
+    run_retention()
+    entry.async_on_unload(
+        async_track_time_interval(hass, run_retention, timedelta(hours=1))
+    )
+
+    # Capture SoC from the battery entity's state changes with a heartbeat,
+    # change-only storage keeps every change and uses it as a keepalive
+    soc_deadband = entry.data.get(CONF_SOC_DEADBAND, DEFAULT_SOC_DEADBAND)
+    if storage_mode == STORAGE_MODE_CHANGE:
+        soc_deadband = 0
+    soc_capture = SocCapture(
+        hass,
+        battery_charge_entity_id,
+        soc_deadband,
+        timedelta(
+            minutes=entry.data.get(
+                CONF_SOC_HEARTBEAT_MINUTES, DEFAULT_SOC_HEARTBEAT_MINUTES
+            )
+        ),
+    )
+    entry.async_on_unload(soc_capture.async_start())
+
+    # Fill the history from before the install out of the recorder, resumable
+    hass.async_create_task(async_run_backfill(hass, battery_charge_entity_id))
 
     ## Battery Sensor updates ###
     async def update_sensors(now):
@@ -133,20 +287,15 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
 
     ####
     ####
-    async def update_battery_use_sensors(now):
-        sensors = hass.data[DOMAIN].get("average_use_sensors", [])
-        for sensor in sensors:
-            await sensor.async_update()
-
-    async_track_time_interval(hass, update_battery_use_sensors, timedelta(minutes=2))
-
-    async def update_battery_charging_sensors(now):
-        sensors = hass.data[DOMAIN].get("average_charge_sensors", [])
-        for sensor in sensors:
-            await sensor.async_update()
+    async def update_battery_usage_sensors(now):
+        # Usage and charge sensors share one multi-window calculation
+        sensors = hass.data[DOMAIN].get("average_use_sensors", []) + hass.data[
+            DOMAIN
+        ].get("average_charge_sensors", [])
+        await async_update_usage_sensors(hass, sensors)
 
     async_track_time_interval(
-        hass, update_battery_charging_sensors, timedelta(minutes=2)
+        hass, update_battery_usage_sensors, timedelta(minutes=2)
     )
 
     async def update_battery_prediction_sensors(now):
@@ -219,22 +368,10 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
             await asyncio.sleep((next_update_time - now).total_seconds())
 
             try:
-                # Fetch new rates data
-                for rate_type in [
-                    "rates_from_midnight",
-                    "afternoon_today",
-                    "evening_today" "afternoon_tomorrow",
-                    "all_rates",
-                    "current_import_rate",
-                    "rates_left",
-                ]:
-                    fetched_data = await get_octopus_energy_rates(
-                        api_key, account_id, rate_type
-                    )
-                    if fetched_data:
-                        hass.data[DOMAIN]["rates_data"][rate_type] = fetched_data
-
-                hass.data[DOMAIN]["rates_data"]["last_update"] = datetime.now()
+                # Fetch new rates data, every view from one download, retrying
+                # through an outage on the saved rates
+                while not await async_refresh_rates(hass, account_id):
+                    await asyncio.sleep(RATES_RETRY_SECONDS)
                 _LOGGER.info("Rates data updated.")
 
                 # Trigger updates for each OctopusEnergySensor
@@ -247,7 +384,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
                 # Wait a while before retrying to prevent spamming in case of persistent errors
                 await asyncio.sleep(60 * 5)  # Retry after 5 minutes
 
-    hass.loop.create_task(periodic_rate_update(api_key, account_id, hass))
+    track_rate_task(hass, periodic_rate_update(api_key, account_id, hass))
 
     update_charge_plan = hass.data[DOMAIN]["update_charge_plan"]
 
@@ -288,15 +425,59 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
             await asyncio.sleep(seconds_until_next_update)
 
     async def start_local_rates_update(event):
-        hass.loop.create_task(local_rates_update())
+        track_rate_task(hass, local_rates_update())
 
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, start_local_rates_update)
 
     return True
 
 
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
+    """Unload a config entry and close the SoC database connections."""
+    unload_ok = await hass.config_entries.async_unload_platforms(
+        entry, [Platform.SENSOR, Platform.SWITCH, Platform.NUMBER]
+    )
+    for task in hass.data[DOMAIN].pop("rate_tasks", set()):
+        task.cancel()
+    soc_writer = hass.data[DOMAIN].pop("soc_writer", None)
+    if soc_writer:
+        await hass.async_add_executor_job(soc_writer.close)
+    soc_read_pool = hass.data[DOMAIN].pop("soc_read_pool", None)
+    if soc_read_pool:
+        soc_read_pool.close()
+    return unload_ok
+
+
+def track_rate_task(hass, coro):
+    """Start a rates task that is cancelled when the entry unloads."""
+    task = hass.async_create_task(coro)
+    tasks = hass.data[DOMAIN].setdefault("rate_tasks", set())
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return task
+
+
 def update_local_rates_data(hass):
     """Update local rates data based on the current time."""
+    rates_import = hass.data[DOMAIN].get("rates_raw")
+    if rates_import is not None:
+        # Rebuilding every view keeps the date views right after midnight
+        # even when Octopus can't be reached for the next fetch
+        hass.data[DOMAIN]["rates_data"].update(store_rate_views(rates_import))
+        _LOGGER.info("Rebuilt rate views from the saved rates.")
+    else:
+        update_current_rates(hass)
+
+    _LOGGER.info("Local rates data updated.")
+    for sensor in hass.data[DOMAIN].get("sensors", []):
+        if isinstance(sensor, OctopusEnergySensor):
+            hass.create_task(sensor.async_refresh())
+
+    _LOGGER.info("Local rates data updated and sensor updates triggered.")
+
+
+def update_current_rates(hass):
+    """Update the current rate and rates left from all_rates alone."""
     now = datetime.now()
 
     # Update current_import_rate
@@ -332,47 +513,46 @@ def update_local_rates_data(hass):
     hass.data[DOMAIN]["rates_data"]["rates_left"] = rates_left
     _LOGGER.info(f"Updated rates left: {rates_left}")
 
-    _LOGGER.info("Local rates data updated.")
-    for sensor in hass.data[DOMAIN].get("sensors", []):
-        if isinstance(sensor, OctopusEnergySensor):
-            hass.create_task(sensor.async_refresh())
 
-    _LOGGER.info("Local rates data updated and sensor updates triggered.")
+# Seconds between rate fetch attempts while Octopus can't be reached
+RATES_RETRY_SECONDS = 5 * 60
+
+
+async def async_refresh_rates(hass, account_id):
+    """Fetch the rates once and store every view, returns True on success.
+
+    On failure the last rates are kept, so an Octopus outage leaves the
+    sensors and the charge plan on the saved copy. The startup fetch and the
+    daily refresh share a lock, so their retries never overlap.
+    """
+    async with hass.data[DOMAIN]["rates_lock"]:
+        rates_import = await fetch_unit_rates(
+            get_octopus_client(hass), account_id, get_tariff_cache(hass)
+        )
+        if rates_import is None:
+            _LOGGER.error("Failed to fetch rates data.")
+            return False
+        fetched_at = datetime.now()
+        hass.data[DOMAIN]["rates_raw"] = rates_import
+        hass.data[DOMAIN]["rates_data"].update(store_rate_views(rates_import))
+        hass.data[DOMAIN]["rates_data"]["last_update"] = fetched_at
+        await hass.data[DOMAIN]["rates_store"].async_save(rates_import, fetched_at)
+    return True
 
 
 async def get_tariff_background(api_key, account_id, hass):
-    """Background task for fetching tariff."""
-    try:
-        tariff, product_code = await get_tariff(api_key, account_id)
-        if tariff and product_code:
-            hass.data[DOMAIN]["tariff"] = tariff
-            hass.data[DOMAIN]["product_code"] = product_code
-
-            rate_types = [
-                "rates_from_midnight",
-                "afternoon_today",
-                "evening_today",
-                "afternoon_tomorrow",
-                "all_rates",
-                "current_import_rate",
-                "rates_left",
-            ]
-            rates_data = {}
-            for rate_type in rate_types:
-                fetched_data = await get_octopus_energy_rates(
-                    api_key, account_id, rate_type
-                )
-                if fetched_data:
-                    rates_data[rate_type] = fetched_data
-
-            if rates_data:
-                hass.data[DOMAIN]["rates_data"] = rates_data
-            else:
-                _LOGGER.error("Failed to fetch rates data.")
-        else:
-            _LOGGER.error("Failed to fetch tariff information.")
-    except Exception as e:
-        _LOGGER.error(f"Error fetching tariff information: {e}")
+    """Background task for fetching tariff, retried until Octopus answers."""
+    while True:
+        # The daily refresh may have fetched the rates in the meantime
+        last_update = hass.data[DOMAIN]["rates_data"].get("last_update")
+        if last_update is not None and not rates_are_stale(last_update):
+            return
+        try:
+            if await async_refresh_rates(hass, account_id):
+                return
+        except Exception as e:
+            _LOGGER.error(f"Error fetching tariff information: {e}")
+        await asyncio.sleep(RATES_RETRY_SECONDS)
 
 
 async def wait_for_valid_state(hass, entity_id):
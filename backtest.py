@@ -0,0 +1,323 @@
+"""Offline backtest of the SoC predictors over recorded or synthetic history.
+
+Replays a soc_data.db (or a synthetic series) at many forecast origins and
+scores each predictor per horizon, then writes a JSON comparison report.
+Runs outside Home Assistant with only numpy, e.g.
+
+    python backtest.py --db database/soc_data.db
+    python backtest.py --synthetic 365 --output report.json
+
+The fits follow the storage mode the history was recorded in, change-only
+history is replayed on a one-minute step grid and sampled history on its
+own samples. Every origin's lookback window comes from cumulative sums so
+all origins are fitted at once. Charging samples are dropped with the
+integration's own segmenter and the profile predictor is the integration's
+own, fed one sample at a time.
+"""
+# backtest.py
+import argparse
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from const import DEFAULT_SOC_STORAGE_MODE, STORAGE_MODE_CHANGE, STORAGE_MODE_SAMPLE
+from soc_rate_profile import ProfileSocModel, SocProfile
+from soc_segments import CHARGING, segment_soc
+
+GRID_SECONDS = 60
+
+# Matches the prediction sensors and the peak hours sensor
+LOOKBACKS = {"1d": 24 * 60, "10h": 10 * 60}
+HORIZONS_MINUTES = (30, 60, 120, 180, 360, 720)
+
+# Same threshold as fit_soc_model before it falls back to the average
+MINIMUM_REQUIRED_DATA_POINTS = 260
+
+# Origins timed through the live per-call np.linalg.lstsq path
+LIVE_TIMING_CALLS = 200
+
+
+def load_database(path):
+    """Return (timestamps, socs) arrays from a soc_data.db, oldest first."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT ts, soc FROM soc_data ORDER BY ts").fetchall()
+    finally:
+        conn.close()
+    data = np.array(rows, dtype=float).reshape(-1, 2)
+    return data[:, 0], data[:, 1]
+
+
+def synthetic_series(days, seed=0):
+    """Return a minute series with overnight charging and an evening peak."""
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(days * 24 * 60)
+    hour = (minutes // 60) % 24
+    drain = np.where((hour >= 16) & (hour < 20), 0.12, 0.03)
+    drain = drain * rng.uniform(0.5, 1.5, len(minutes))
+    socs = np.empty(len(minutes))
+    soc = 100.0
+    for i in range(len(minutes)):
+        soc = min(soc + 0.4, 100) if 1 <= hour[i] < 5 else max(soc - drain[i], 10)
+        socs[i] = soc
+    socs = np.round(socs + rng.normal(0, 0.05, len(socs)), 1)
+    return minutes * GRID_SECONDS + 1.7e9, socs
+
+
+def fit_points(timestamps, socs, storage_mode):
+    """Return (t in minutes, socs, kept) as the live fit sees the history.
+
+    Change-only history is expanded onto a one-minute step grid, each point
+    the sample in force, sampled history is used as stored. kept is False
+    for points the segmenter labels as charging.
+    """
+    labels = segment_soc(socs)
+    if storage_mode == STORAGE_MODE_CHANGE:
+        grid = np.arange(timestamps[0], timestamps[-1] + 1, GRID_SECONDS)
+        index = np.searchsorted(timestamps, grid, "right") - 1
+        timestamps, socs, labels = grid, socs[index], labels[index]
+    return (timestamps - timestamps[0]) / GRID_SECONDS, socs, labels != CHARGING
+
+
+def window_sums(t, weights, socs):
+    """Return cumulative sums of n, t, t², y and ty."""
+    return [
+        np.concatenate(([0], np.cumsum(values)))
+        for values in (
+            weights,
+            weights * t,
+            weights * t * t,
+            weights * socs,
+            weights * t * socs,
+        )
+    ]
+
+
+def window_bounds(t, origins, lookback):
+    """Return [lo, hi) point indices of each origin's lookback window."""
+    lo = np.searchsorted(t, origins - lookback, "left")
+    hi = np.searchsorted(t, origins, "right")
+    return lo, hi
+
+
+def predict_linear(sums, lo, hi, future):
+    """Linear fit over each origin's window, the mean below the threshold.
+
+    future holds the minutes predicted for, one row per origin. Returns
+    (predictions[origin, horizon], fell back to the mean[origin]).
+    """
+    n, st, stt, sy, sty = (values[hi] - values[lo] for values in sums)
+    denominator = n * stt - st * st
+    valid = (n >= MINIMUM_REQUIRED_DATA_POINTS) & (denominator > 0)
+    safe = np.where(denominator > 0, denominator, 1)
+    slope = np.where(valid, (n * sty - st * sy) / safe, 0)
+    mean = sy / np.maximum(n, 1)
+    intercept = np.where(valid, (sy - slope * st) / np.maximum(n, 1), mean)
+    predicted = np.minimum(slope[:, None] * future + intercept[:, None], 100)
+    return predicted, ~valid
+
+
+def predict_mean(sums, lo, hi, horizons):
+    """The lookback average, estimate_based_on_available_data on its own."""
+    n = sums[0][hi] - sums[0][lo]
+    mean = (sums[3][hi] - sums[3][lo]) / np.maximum(n, 1)
+    return np.repeat(mean[:, None], len(horizons), axis=1)
+
+
+def predict_persistence(socs_in_force, horizons):
+    """The SoC at the origin, a baseline any predictor should beat."""
+    return np.repeat(socs_in_force[:, None], len(horizons), axis=1)
+
+
+def predict_profile(timestamps, socs, origin_ts, horizons):
+    """Replay the hour-of-week profile, returns (predictions, seconds per origin).
+
+    Samples are fed to a SocProfile in time order and each origin predicts
+    from a snapshot of it, as SocProfileStore.model() does live.
+    """
+    profile = SocProfile()
+    timestamps, socs = timestamps.tolist(), socs.tolist()
+    horizons = (np.asarray(horizons) * GRID_SECONDS).tolist()
+    predicted = np.empty((len(origin_ts), len(horizons)))
+    predict_seconds = 0.0
+    position = 0
+    for i, origin in enumerate(origin_ts.tolist()):
+        while position < len(timestamps) and timestamps[position] <= origin:
+            profile.add(timestamps[position], socs[position])
+            position += 1
+        started = time.perf_counter()
+        model = ProfileSocModel(list(profile.rates), *profile.last_sample)
+        predicted[i] = model.predict(horizons, origin)
+        predict_seconds += time.perf_counter() - started
+    return predicted, predict_seconds / max(len(origin_ts), 1)
+
+
+def time_live_fits(t, socs, keep, lo, hi):
+    """Return mean seconds per call of the live vstack/lstsq fit and predict."""
+    step = max(len(lo) // LIVE_TIMING_CALLS, 1)
+    picked = list(zip(lo[::step], hi[::step]))[:LIVE_TIMING_CALLS]
+    if not picked:
+        return None, None
+    fit_seconds = predict_seconds = 0.0
+    for start, stop in picked:
+        mask = keep[start:stop]
+        x = t[start:stop][mask]
+        y = socs[start:stop][mask]
+        if len(x) < 2:
+            continue
+        started = time.perf_counter()
+        A = np.vstack([x - x[0], np.ones(len(x))]).T
+        m, c = np.linalg.lstsq(A, y, rcond=None)[0]
+        fitted = time.perf_counter()
+        min(m * (x[-1] + 60 - x[0]) + c, 100)
+        predict_seconds += time.perf_counter() - fitted
+        fit_seconds += fitted - started
+    return fit_seconds / len(picked), predict_seconds / len(picked)
+
+
+def score(predicted, actual):
+    errors = predicted - actual
+    return {
+        "mae": round(float(np.mean(np.abs(errors))), 3),
+        "rmse": round(float(np.sqrt(np.mean(errors * errors))), 3),
+        "bias": round(float(np.mean(errors)), 3),
+    }
+
+
+def score_horizons(predicted, actual, horizons):
+    return {
+        str(h): score(predicted[:, i], actual[:, i]) for i, h in enumerate(horizons)
+    }
+
+
+def run_backtest(
+    timestamps,
+    socs,
+    origin_step,
+    storage_mode=DEFAULT_SOC_STORAGE_MODE,
+    horizons=HORIZONS_MINUTES,
+):
+    """Return the report dict for a series, origins every origin_step minutes."""
+    t, points, keep = fit_points(timestamps, socs, storage_mode)
+    sums = window_sums(t, keep.astype(float), points)
+    horizons = np.asarray(horizons)
+    # Origins on the minute grid, each with a full lookback behind it and its
+    # longest horizon inside the data
+    span = (timestamps[-1] - timestamps[0]) / GRID_SECONDS
+    origins = np.arange(max(LOOKBACKS.values()), span - horizons.max(), origin_step)
+    report = {
+        "samples": len(timestamps),
+        "storage_mode": storage_mode,
+        "fit_points": len(points),
+        "origins": len(origins),
+        "horizons_minutes": horizons.tolist(),
+        "predictors": {},
+    }
+    if not len(origins):
+        return report
+    origin_ts = timestamps[0] + origins * GRID_SECONDS
+    future = origins[:, None] + horizons[None, :]
+
+    # The sample in force at each origin and at each horizon after it
+    def in_force(moments):
+        return socs[np.searchsorted(timestamps, moments, "right") - 1]
+
+    actual = in_force(origin_ts[:, None] + horizons[None, :] * GRID_SECONDS)
+
+    for name, lookback in LOOKBACKS.items():
+        lo, hi = window_bounds(t, origins, lookback)
+        started = time.perf_counter()
+        predicted, fell_back = predict_linear(sums, lo, hi, future)
+        elapsed = time.perf_counter() - started
+        live_fit, live_predict = time_live_fits(t, points, keep, lo, hi)
+        report["predictors"][f"linear_{name}"] = {
+            "errors": score_horizons(predicted, actual, horizons),
+            "mean_fallbacks": int(fell_back.sum()),
+            "seconds_per_origin": elapsed / len(origins),
+            "live_fit_seconds": live_fit,
+            "live_predict_seconds": live_predict,
+        }
+
+        started = time.perf_counter()
+        predicted = predict_mean(sums, lo, hi, horizons)
+        elapsed = time.perf_counter() - started
+        report["predictors"][f"mean_{name}"] = {
+            "errors": score_horizons(predicted, actual, horizons),
+            "seconds_per_origin": elapsed / len(origins),
+        }
+
+    predicted, seconds = predict_profile(timestamps, socs, origin_ts, horizons)
+    report["predictors"]["profile"] = {
+        "errors": score_horizons(predicted, actual, horizons),
+        "seconds_per_origin": seconds,
+    }
+
+    predicted = predict_persistence(in_force(origin_ts), horizons)
+    report["predictors"]["persistence"] = {
+        "errors": score_horizons(predicted, actual, horizons),
+    }
+    return report
+
+
+def print_report(report):
+    horizons = report["horizons_minutes"]
+    print(
+        f"{report['samples']} samples, {report['fit_points']} fit points "
+        f"({report['storage_mode']} storage), {report['origins']} origins"
+    )
+    print("MAE in % SoC by horizon (minutes)")
+    print(f"{'predictor':<16}" + "".join(f"{h:>8}" for h in horizons))
+    for name, result in report["predictors"].items():
+        maes = "".join(f"{result['errors'][str(h)]['mae']:>8}" for h in horizons)
+        print(f"{name:<16}{maes}")
+    for name, result in report["predictors"].items():
+        if result.get("live_fit_seconds") is not None:
+            print(
+                f"{name}: live fit {result['live_fit_seconds'] * 1e6:.0f}us, "
+                f"predict {result['live_predict_seconds'] * 1e6:.1f}us per call, "
+                f"backtest {result['seconds_per_origin'] * 1e6:.2f}us per origin"
+            )
+    if "profile" in report["predictors"]:
+        seconds = report["predictors"]["profile"]["seconds_per_origin"]
+        print(f"profile: predict {seconds * 1e6:.1f}us per origin")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="path to a soc_data.db to replay")
+    source.add_argument(
+        "--synthetic", type=int, metavar="DAYS", help="days of synthetic data"
+    )
+    parser.add_argument(
+        "--storage-mode",
+        choices=[STORAGE_MODE_SAMPLE, STORAGE_MODE_CHANGE],
+        default=DEFAULT_SOC_STORAGE_MODE,
+        help="the SoC storage mode the history was recorded in",
+    )
+    parser.add_argument(
+        "--origin-step", type=int, default=30, help="minutes between origins"
+    )
+    parser.add_argument("--output", default="backtest_report.json", help="report path")
+    args = parser.parse_args()
+
+    if args.db:
+        timestamps, socs = load_database(args.db)
+    else:
+        timestamps, socs = synthetic_series(args.synthetic)
+    if len(timestamps) < 2:
+        parser.error("not enough samples to backtest")
+
+    started = time.perf_counter()
+    report = run_backtest(timestamps, socs, args.origin_step, args.storage_mode)
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print_report(report)
+    print(f"Backtest took {report['seconds']}s, report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
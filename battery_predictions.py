@@ -1,139 +1,235 @@
-import sqlite3
-from datetime import datetime, timedelta
-import numpy as np
-from sklearn.linear_model import LinearRegression
+from datetime import date, datetime, time, timedelta
 from homeassistant.core import HomeAssistant
-import numpy as np
-from numpy.polynomial.polynomial import Polynomial
-from datetime import time, datetime, date
-from .const import DOMAIN
+from .battery_soc_calcs import get_soc_segments
+from .soc_database import to_epoch
+from .soc_history import get_data_version, is_step_storage
+from .prediction_cache import get_prediction_cache
+from .soc_profile import get_soc_profile
+from .soc_regression import StreamingSocModel, get_soc_regressions
+from .soc_segments import CHARGING
 import logging
 
 _LOGGER = logging.getLogger(__name__)
 
-DATABASE_FILENAME = "soc_data.db"
+# Grid spacing used to expand change-only history for regression
+STEP_GRID_SECONDS = 60
+
+# Model types, a straight-line fit over the lookback, the same line kept up
+# to date per sample, or the hour-of-week rate profile integrated forward
+# from the latest sample
+MODEL_LINEAR = "linear"
+MODEL_STREAMING = "streaming"
+MODEL_PROFILE = "profile"
+
+# Samples needed before a line is fitted instead of the average SoC
+MINIMUM_REQUIRED_DATA_POINTS = 260
+
+# Half-hour slots covered by the full-day trajectory forecast
+FORECAST_SLOT = timedelta(minutes=30)
+FORECAST_SLOTS = 48
+
+
+def step_grid_index(timestamps, start_ts, end_ts, step=STEP_GRID_SECONDS):
+    """Return (grid, index of the sample in force at each grid point)."""
+    import numpy as np
+
+    grid = np.arange(max(start_ts, timestamps[0]), end_ts + 1, step, dtype=float)
+    return grid, np.searchsorted(timestamps, grid, "right") - 1
+
+
+def resample_step(timestamps, socs, start_ts, end_ts, step=STEP_GRID_SECONDS):
+    """Expand a step-function SoC series onto a uniform time grid.
+
+    Each grid point takes the value of the last sample at or before it, so
+    long flat stretches weigh in a regression as much as they lasted.
+    """
+    if not len(timestamps):
+        return timestamps, socs
+    grid, index = step_grid_index(timestamps, start_ts, end_ts, step)
+    return grid, socs[index]
 
 
 def fetch_historical_data(hass: HomeAssistant, lookback_period: timedelta):
-    db_path = hass.config.path(
-        "custom_components", "battery_automation", "database", DATABASE_FILENAME
-    )
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    """Return (epoch seconds, soc) arrays for the lookback period, oldest first.
 
+    Samples the segmenter labels as charging are left out so the fit follows
+    the battery's usage.
+    """
     end_time = datetime.now()
     start_time = end_time - lookback_period
-    cursor.execute(
-        "SELECT timestamp, soc FROM soc_data WHERE timestamp BETWEEN ? AND ?",
-        (start_time, end_time),
-    )
-    data = cursor.fetchall()
-    conn.close()
-
-    # Define the time range to exclude for today's date
-    today = datetime.now().date()
-    exclude_start = datetime.combine(today, time(0, 54))
-    exclude_end = datetime.combine(today, time(6, 50))
-
-    # Exclude data between 00:54 and 06:50 only for today's date
-    filtered_data = []
-    for timestamp_str, soc in data:
-        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S.%f")
-        if not (exclude_start <= timestamp <= exclude_end):
-            filtered_data.append((timestamp_str, soc))
+    timestamps, socs, labels = get_soc_segments(hass, start_time, end_time)
+    if is_step_storage(hass) and len(timestamps):
+        timestamps, index = step_grid_index(
+            timestamps, to_epoch(start_time), to_epoch(end_time)
+        )
+        socs, labels = socs[index], labels[index]
 
-    return filtered_data
+    keep = labels != CHARGING
+    return timestamps[keep], socs[keep]
 
 
 def is_peak_hour(timestamp):
     return 16 <= timestamp.hour < 19  # 4 PM to 7 PM
 
 
-def is_charging_period(historical_data):
-    """Determine if the given period is a charging period based on consecutive SoC increases."""
-    increases = 0
-    for i in range(1, len(historical_data)):
-        if historical_data[i][1] > historical_data[i - 1][1]:
-            increases += 1
-        else:
-            increases = 0
+class LinearSocModel:
+    """A straight line through the lookback SoC, evaluated for many horizons."""
 
-        # Consider it a charging period if there are several consecutive increases
-        if increases >= 2:
-            return True
-    return False
+    def __init__(self, slope, intercept, origin):
+        self.slope = slope
+        self.intercept = intercept
+        # Epoch seconds the line's x axis starts at
+        self.origin = origin
 
+    def predict(self, horizons, now=None):
+        """Return the predicted SoC for each horizon in seconds from now."""
+        import numpy as np
 
-def predict_future_state(
-    hass: HomeAssistant, prediction_horizon: timedelta, lookback_period: timedelta
-):
-    minimum_required_data_points = 260
-    historical_data = fetch_historical_data(hass, lookback_period)
+        now = to_epoch(datetime.now()) if now is None else now
+        future = now + np.asarray(horizons, dtype=float) - self.origin
+        # Cap the predicted SoC at 100% and format to two decimal places
+        predicted = np.minimum(self.slope * future + self.intercept, 100)
+        return [round(float(soc), 2) for soc in predicted]
+
+
+class MeanSocModel:
+    """Fallback while there is too little data for a line, the average SoC."""
+
+    def __init__(self, mean):
+        self.mean = mean
+
+    def predict(self, horizons, now=None):
+        return [self.mean for _ in horizons]
+
+
+def fit_soc_model(hass: HomeAssistant, lookback_period: timedelta):
+    """Fit the SoC model over the lookback period once.
+
+    Returns a model whose predict() takes any number of horizons, or None if
+    there isn't enough data for an estimate.
+    """
+    import numpy as np
+
+    timestamps, soc_values = fetch_historical_data(hass, lookback_period)
 
     # Check if there is enough data
-    if len(historical_data) < minimum_required_data_points:
+    if len(timestamps) < MINIMUM_REQUIRED_DATA_POINTS:
         # Not enough data, use an alternative estimation method
-        return estimate_based_on_available_data(historical_data)
-
-    # Convert datetime objects to numeric values (e.g., seconds since start of data)
-    start_time = datetime.strptime(historical_data[0][0], "%Y-%m-%d %H:%M:%S.%f")
-    timestamps = np.array(
-        [
-            (
-                datetime.strptime(t[0], "%Y-%m-%d %H:%M:%S.%f") - start_time
-            ).total_seconds()
-            for t in historical_data
-        ]
-    )
-    soc_values = np.array([t[1] for t in historical_data])
+        return estimate_based_on_available_data(soc_values)
+
+    # Timestamps are epoch seconds, shift them to seconds since start of data
+    start_time = timestamps[0]
+    timestamps = timestamps - start_time
 
     # Perform linear regression using numpy
     A = np.vstack([timestamps, np.ones(len(timestamps))]).T
     m, c = np.linalg.lstsq(A, soc_values, rcond=None)[0]
+    return LinearSocModel(m, c, start_time)
+
+
+def streaming_soc_model(hass: HomeAssistant, lookback_period: timedelta):
+    """Return the streaming line for the lookback in O(1), no numpy needed."""
+    regressions = get_soc_regressions(hass)
+    if regressions is None:
+        return None
+    regression = regressions.register(lookback_period)
+    if len(regression) < MINIMUM_REQUIRED_DATA_POINTS:
+        mean = regression.mean() if len(regression) >= 2 else None
+        return None if mean is None else MeanSocModel(mean)
+    coefficients = regression.coefficients()
+    return None if coefficients is None else StreamingSocModel(*coefficients)
+
+
+def build_soc_model(hass: HomeAssistant, lookback_period: timedelta, model_type):
+    if model_type == MODEL_PROFILE:
+        profile = get_soc_profile(hass)
+        return None if profile is None else profile.model()
+    if model_type == MODEL_STREAMING:
+        return streaming_soc_model(hass, lookback_period)
+    return fit_soc_model(hass, lookback_period)
 
-    # Predict future state
-    future_timestamp = (
-        datetime.now() + prediction_horizon - start_time
-    ).total_seconds()
-    predicted_soc = m * future_timestamp + c
 
-    # Cap the predicted SoC at 100% and format to two decimal places
-    predicted_soc = min(predicted_soc, 100)
-    formatted_soc = round(predicted_soc, 2)
+def get_soc_model(
+    hass: HomeAssistant, lookback_period: timedelta, model_type=MODEL_LINEAR
+):
+    """Return the SoC model for the lookback, built once per data version."""
+    version = get_data_version(hass)
+    if version is None:
+        return build_soc_model(hass, lookback_period, model_type)
+    key = (model_type, lookback_period.total_seconds(), version, None)
+    return get_prediction_cache(hass).get_or_compute(
+        key, lambda: build_soc_model(hass, lookback_period, model_type)
+    )
+
 
-    return formatted_soc
+def predict_future_state(
+    hass: HomeAssistant,
+    prediction_horizon: timedelta,
+    lookback_period: timedelta,
+    model_type=MODEL_LINEAR,
+):
+    # Only the fit is cached, the prediction runs from the current time
+    model = get_soc_model(hass, lookback_period, model_type)
+    if model is None:
+        return None
+    return model.predict([prediction_horizon.total_seconds()])[0]
 
 
-def predict_peak_hours_soc(hass: HomeAssistant, lookback_period: timedelta):
+def predict_peak_hours_soc(
+    hass: HomeAssistant, lookback_period: timedelta, model_type=MODEL_LINEAR
+):
     # 4 PM to 7 PM in half-hour intervals, and 10 PM
     specific_hours = [time(hour=h, minute=m) for h in range(16, 19) for m in [0, 30]]
     specific_hours.append(time(hour=22, minute=0))  # Adding 10 PM
 
-    predictions = {}
+    now = datetime.now()
+    horizons = {}
     for specific_hour in specific_hours:
-        prediction_horizon = (
-            datetime.combine(date.today(), specific_hour) - datetime.now()
-        )
+        prediction_horizon = datetime.combine(date.today(), specific_hour) - now
         if prediction_horizon.total_seconds() > 0:  # Only predict for future times
-            predicted_soc = predict_future_state(
-                hass, prediction_horizon, lookback_period
+            horizons[specific_hour.strftime("%H:%M")] = (
+                prediction_horizon.total_seconds()
             )
-            if predicted_soc is not None:
-                predictions[specific_hour.strftime("%H:%M")] = predicted_soc
-            else:
-                # If no prediction available, estimate based on available data
-                predicted_soc = estimate_based_on_available_data(hass, lookback_period)
-                predictions[specific_hour.strftime("%H:%M")] = predicted_soc
+    if not horizons:
+        return {}
+
+    # One fit, cached per data version, evaluated at every peak time
+    model = get_soc_model(hass, lookback_period, model_type)
+    if model is None:
+        return {key: None for key in horizons}
+    return dict(zip(horizons, model.predict(list(horizons.values()), to_epoch(now))))
 
-    return predictions
 
+def forecast_slot_times(now: datetime, slots=FORECAST_SLOTS):
+    """Return the starts of the next slots half-hour slots after now."""
+    first = now.replace(minute=now.minute // 30 * 30, second=0, microsecond=0)
+    return [first + FORECAST_SLOT * (i + 1) for i in range(slots)]
 
-def estimate_based_on_available_data(hass: HomeAssistant, lookback_period: timedelta):
-    # Fetch available historical data
-    historical_data = fetch_historical_data(hass, lookback_period)
-    if len(historical_data) < 2:
+
+def predict_soc_trajectory(
+    hass: HomeAssistant,
+    lookback_period: timedelta,
+    model_type=MODEL_LINEAR,
+    slots=FORECAST_SLOTS,
+):
+    """Return [(slot start, predicted SoC)] for the next slots half-hour slots.
+
+    The model is evaluated once for all slots.
+    """
+    now = datetime.now()
+    slot_times = forecast_slot_times(now, slots)
+    model = get_soc_model(hass, lookback_period, model_type)
+    if model is None:
+        return []
+    now_ts = to_epoch(now)
+    horizons = [to_epoch(slot_time) - now_ts for slot_time in slot_times]
+    return list(zip(slot_times, model.predict(horizons, now_ts)))
+
+
+def estimate_based_on_available_data(soc_values):
+    """Return a MeanSocModel of the fetched SoC values, or None if too few."""
+    if len(soc_values) < 2:
         return None  # Not enough data to make any estimate
 
     # Simple estimation logic, e.g., average of available data
-    soc_values = [data[1] for data in historical_data]  # Extract SoC values
-    return sum(soc_values) / len(soc_values)  # Return average SoC
+    return MeanSocModel(float(soc_values.mean()))  # Return average SoC
@@ -1,50 +1,129 @@
-import sqlite3
 import logging
 from datetime import datetime, timedelta
 from homeassistant.core import HomeAssistant
-from .const import DOMAIN
-import os
-import sqlite3
+from .soc_archive import get_soc_archive
+from .soc_database import ROLLUP_TIERS, get_pending_samples, read_connection, to_epoch
+from .soc_history import get_soc_history, is_step_storage
+from .soc_segments import CHARGING, segment_soc
 
 
 _LOGGER = logging.getLogger(__name__)
-DATABASE_FILENAME = "soc_data.db"
+
+RAW_SQL = "SELECT ts, soc FROM soc_data WHERE ts BETWEEN ? AND ? ORDER BY ts"
+
+# Timestamp of the sample in force at a time, for step-function reads
+STEP_START_SQL = "SELECT COALESCE(MAX(ts), ?) FROM soc_data WHERE ts <= ?"
 
 
 ### Data Retreval function ###
-def get_soc_data(hass: HomeAssistant, start_time: datetime, end_time: datetime):
-    db_path = hass.config.path(
-        "custom_components", "battery_automation", "database", DATABASE_FILENAME
-    )
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def get_soc_data(
+    hass: HomeAssistant, start_time: datetime, end_time: datetime, carry_forward=False
+):
+    """Return (epoch seconds, soc) rows between two datetimes, oldest first.
+
+    With carry_forward the rows start at the sample in force at start_time.
+    Reads come from the binary archive when it is the history backend, and
+    samples still buffered in the writer are included.
+    """
+    start, end = to_epoch(start_time), to_epoch(end_time)
+    archive = get_soc_archive(hass)
+    if archive is not None:
+        data = archive.get_soc_data(start_time, end_time, carry_forward)
+    else:
+        with read_connection(hass) as conn:
+            step_start = start
+            if carry_forward:
+                step_start = conn.execute(STEP_START_SQL, (start, start)).fetchone()[0]
+            data = conn.execute(RAW_SQL, (step_start, end)).fetchall()
+
+    return data + get_pending_samples(hass, start, end, data[-1][0] if data else None)
 
-    cursor.execute(
-        "SELECT timestamp, soc FROM soc_data WHERE timestamp BETWEEN ? AND ?",
-        (start_time, end_time),
-    )
-    data = cursor.fetchall()
-    conn.close()
 
-    return data
+def get_rollup_samples(hass: HomeAssistant, start_ts, end_ts):
+    """Return (bucket start, first soc) rows of the finest rollup tier.
+
+    One row per bucket starting in start_ts..end_ts, a coarse stand-in for
+    raw samples that retention has already pruned.
+    """
+    table = ROLLUP_TIERS[0][0]
+    with read_connection(hass) as conn:
+        return conn.execute(
+            f"""SELECT bucket, soc_first FROM {table}
+                WHERE bucket >= ? AND bucket < ? ORDER BY bucket""",
+            (start_ts, end_ts),
+        ).fetchall()
+
+
+def read_archive_arrays(hass: HomeAssistant, archive, start, end, carry_forward):
+    """Return archive arrays for start..end with the writer's buffered samples."""
+    import numpy as np
+
+    timestamps, socs = archive.read_arrays(start, end, carry_forward)
+    pending = get_pending_samples(
+        hass, start, end, timestamps[-1] if len(timestamps) else None
+    )
+    if pending:
+        timestamps = np.concatenate((timestamps, [row[0] for row in pending]))
+        socs = np.concatenate((socs, [row[1] for row in pending]))
+    return timestamps, socs
+
+
+def get_soc_arrays(hass: HomeAssistant, start_time: datetime, end_time: datetime):
+    """Return (timestamps, socs) sequences between two datetimes, oldest first.
+
+    Windows held by the in-memory history are zero-copy slices of it, older
+    windows come from the archive or fall back to the database. With
+    change-only storage the sample in force at start_time comes first.
+    """
+    start, end = to_epoch(start_time), to_epoch(end_time)
+    carry_forward = is_step_storage(hass)
+    history = get_soc_history(hass)
+    if history is not None and history.covers(start):
+        return history.window(start, end, carry_forward)
+    archive = get_soc_archive(hass)
+    if archive is not None:
+        return read_archive_arrays(hass, archive, start, end, carry_forward)
+
+    soc_data = get_soc_data(hass, start_time, end_time, carry_forward)
+    return [row[0] for row in soc_data], [row[1] for row in soc_data]
+
+
+def get_soc_segments(hass: HomeAssistant, start_time: datetime, end_time: datetime):
+    """Return (timestamps, socs, labels) numpy arrays like get_soc_arrays.
+
+    The in-memory history labels its samples as they arrive, older windows
+    are segmented on read.
+    """
+    import numpy as np
+
+    start, end = to_epoch(start_time), to_epoch(end_time)
+    history = get_soc_history(hass)
+    if history is not None and history.covers(start):
+        timestamps, socs, labels = history.segments(
+            start, end, is_step_storage(hass)
+        )
+        return np.asarray(timestamps), np.asarray(socs), np.asarray(labels)
+    timestamps, socs = get_soc_arrays(hass, start_time, end_time)
+    socs = np.asarray(socs, dtype=float)
+    return np.asarray(timestamps, dtype=float), socs, segment_soc(socs)
 
 
 #### Avererage Decline ####
 def calculate_average_decline(hass: HomeAssistant, period: timedelta):
     end_time = datetime.now()
     start_time = end_time - period
-    soc_data = get_soc_data(hass, start_time, end_time)
+    _, socs = get_soc_arrays(hass, start_time, end_time)
 
-    if len(soc_data) < 2:
+    if len(socs) < 2:
         _LOGGER.warning("Not enough data to calculate average decline")
         return None
 
     total_decline = 0
     decline_intervals = 0
 
-    for i in range(1, len(soc_data)):
+    for i in range(1, len(socs)):
         # Calculate the change between each consecutive reading
-        change = soc_data[i - 1][1] - soc_data[i][1]  # soc_data[i][1] is the SoC value
+        change = socs[i - 1] - socs[i]
 
         # Only consider decline periods
         if change > 0:
@@ -59,29 +138,94 @@ def calculate_average_decline(hass: HomeAssistant, period: timedelta):
     return average_decline
 
 
-def calculate_average_change(hass: HomeAssistant, period: timedelta):
+def summarise_windows(
+    timestamps, socs, end_ts, periods, carry_forward=False, charging=None
+):
+    """Return {period: change totals} for trailing windows.
+
+    One np.diff over the longest window and cumulative sums of the increases,
+    decreases and their counts give every window's totals from its
+    searchsorted boundaries, with no per-window loop over the samples. Totals
+    are (samples, increase, increase count, decrease, decrease count). With
+    carry_forward each window starts at the sample in force at its start.
+    With a per-sample charging mask, e.g. from the segmenter, increases only
+    count while charging and decreases only while not.
+    """
+    import numpy as np
+
+    timestamps = np.asarray(timestamps, dtype=float)
+    socs = np.asarray(socs, dtype=float)
+    changes = np.diff(socs)
+    rising = changes > 0
+    falling = changes < 0
+    if charging is not None:
+        # Each change is labelled by the sample it led to
+        charging = np.asarray(charging, dtype=bool)[1:]
+        rising &= charging
+        falling &= ~charging
+    cumulative = [
+        np.concatenate(([0], np.cumsum(values)))
+        for values in (
+            np.where(rising, changes, 0),
+            rising,
+            np.where(falling, -changes, 0),
+            falling,
+        )
+    ]
+
+    window_starts = [end_ts - period.total_seconds() for period in periods]
+    if carry_forward:
+        starts = np.maximum(np.searchsorted(timestamps, window_starts, "right") - 1, 0)
+    else:
+        starts = np.searchsorted(timestamps, window_starts, "left")
+    stop = int(np.searchsorted(timestamps, end_ts, "right"))
+    results = {}
+    for period, start in zip(periods, starts):
+        # A window with no samples starts at stop and has no changes
+        start = min(int(start), stop)
+        if stop - start < 2:
+            results[period] = (stop - start, 0.0, 0, 0.0, 0)
+            continue
+        # Changes start..stop-2 lie between samples start..stop-1
+        increase, increases, decrease, decreases = (
+            values[stop - 1] - values[start] for values in cumulative
+        )
+        results[period] = (
+            stop - start,
+            float(increase),
+            int(increases),
+            float(decrease),
+            int(decreases),
+        )
+    return results
+
+
+def calculate_usage_statistics(hass: HomeAssistant, periods):
+    """Return {period: totals} for all periods from a single fetch of the longest.
+
+    Increases are only counted while charging and decreases only while
+    discharging or idle, so small rises during use don't count as charge.
+    """
     end_time = datetime.now()
-    start_time = end_time - period
-    soc_data = get_soc_data(hass, start_time, end_time)
-
-    if len(soc_data) < 2:
-        _LOGGER.warning("Not enough data to calculate average change")
-        return None, None
+    start_time = end_time - max(periods)
+    timestamps, socs, labels = get_soc_segments(hass, start_time, end_time)
+    return summarise_windows(
+        timestamps,
+        socs,
+        to_epoch(end_time),
+        periods,
+        is_step_storage(hass),
+        labels == CHARGING,
+    )
 
-    total_increase = 0
-    increase_count = 0
-    total_decrease = 0
-    decrease_count = 0
 
-    for i in range(1, len(soc_data)):
-        change = soc_data[i][1] - soc_data[i - 1][1]
+def average_change_from_totals(totals):
+    """Return (average increase, average decrease) from change totals."""
+    samples, total_increase, increase_count, total_decrease, decrease_count = totals
 
-        if change > 0:  # Increase in SoC
-            total_increase += change
-            increase_count += 1
-        elif change < 0:  # Decrease in SoC
-            total_decrease += abs(change)  # Use absolute value for decrease
-            decrease_count += 1
+    if samples < 2:
+        _LOGGER.warning("Not enough data to calculate average change")
+        return None, None
 
     average_increase = round((total_increase / increase_count) if increase_count > 0 else 0, 2)
     average_decrease = round((total_decrease / decrease_count) if decrease_count > 0 else 0, 2)
@@ -92,26 +236,17 @@ def calculate_average_change(hass: HomeAssistant, period: timedelta):
     return average_increase, average_decrease
 
 
-def calculate_total_percentage_change(hass: HomeAssistant, period: timedelta, battery_capacity_kwh):
-    end_time = datetime.now()
-    start_time = end_time - period
-    soc_data = get_soc_data(hass, start_time, end_time)
+def total_change_from_totals(totals, battery_capacity_kwh):
+    """Return (total % increase, total % decrease) from change totals."""
+    samples, total_increase, _, total_decrease, _ = totals
 
-    if len(soc_data) < 2:
+    if samples < 2:
         _LOGGER.warning("Not enough data to calculate change")
         return None, None
 
-    total_increase_kwh = 0
-    total_decrease_kwh = 0
-
-    for i in range(1, len(soc_data)):
-        change_percentage = soc_data[i][1] - soc_data[i - 1][1]
-        change_kwh = (change_percentage / 100) * battery_capacity_kwh  # Convert percentage change to kWh
-
-        if change_percentage > 0:
-            total_increase_kwh += change_kwh
-        elif change_percentage < 0:
-            total_decrease_kwh += abs(change_kwh)
+    # Convert percentage changes to kWh
+    total_increase_kwh = (total_increase / 100) * battery_capacity_kwh
+    total_decrease_kwh = (total_decrease / 100) * battery_capacity_kwh
 
     # Convert changes to percentages of the battery's total capacity
     total_percentage_increase = (total_increase_kwh / battery_capacity_kwh) * 100
@@ -122,4 +257,3 @@ def calculate_total_percentage_change(hass: HomeAssistant, period: timedelta, ba
     total_percentage_decrease = round(total_percentage_decrease, 2)
 
     return total_percentage_increase, total_percentage_decrease
-
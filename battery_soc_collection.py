@@ -1,46 +1,45 @@
-import sqlite3
 import logging
 from datetime import datetime, timedelta
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import (
+    async_track_state_change_event,
+    async_track_time_interval,
+)
 from .const import DOMAIN
-import os
+from .soc_database import to_epoch
+from .soc_history import get_soc_history
+from .soc_aggregators import get_soc_aggregators
+from .soc_profile import get_soc_profile
+from .soc_regression import get_soc_regressions
 
 _LOGGER = logging.getLogger(__name__)
-DATABASE_FILENAME = "soc_data.db"
 
 
-def init_database(hass: HomeAssistant):
-    # Create the database directory if it doesn't exist
-    db_directory = hass.config.path(
-        "custom_components", "battery_automation", "database"
-    )
-    if not os.path.exists(db_directory):
-        os.makedirs(db_directory)
+def insert_soc_data(hass: HomeAssistant, soc: float, timestamp: datetime):
+    """Hand a SoC sample to the writer thread and the in-memory history."""
+    writer = hass.data[DOMAIN].get("soc_writer")
+    if writer is None:
+        _LOGGER.warning("SoC writer not running, sample dropped")
+        return
+    ts = to_epoch(timestamp)
+    writer.insert(ts, soc)
+    hass.data[DOMAIN]["last_soc_sample"] = (ts, soc)
 
-    db_path = os.path.join(db_directory, DATABASE_FILENAME)
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(
-        """CREATE TABLE IF NOT EXISTS soc_data
-                      (timestamp DATETIME PRIMARY KEY, soc REAL)"""
-    )
-    conn.commit()
-    conn.close()
+    history = get_soc_history(hass)
+    if history is not None:
+        history.append(ts, soc)
 
+    aggregators = get_soc_aggregators(hass)
+    if aggregators is not None:
+        aggregators.advance(ts)
 
-def insert_soc_data(hass: HomeAssistant, soc: float, timestamp: datetime):
-    db_path = hass.config.path(
-        "custom_components", "battery_automation", "database", DATABASE_FILENAME
-    )
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Include the timestamp in the insert statement
-    cursor.execute(
-        "INSERT INTO soc_data (timestamp, soc) VALUES (?, ?)", (timestamp, soc)
-    )
-    conn.commit()
-    conn.close()
+    profile = get_soc_profile(hass)
+    if profile is not None:
+        profile.add(ts, soc)
+
+    regressions = get_soc_regressions(hass)
+    if regressions is not None:
+        regressions.add(ts, soc)
 
     # Log the insertion
     _LOGGER.info(f"Inserted SoC data: {soc} at {timestamp}")
@@ -69,18 +68,91 @@ async def collect_soc_data(hass: HomeAssistant):
         insert_soc_data(hass, current_soc, current_time)
 
 
-def get_soc_data(hass: HomeAssistant, start_time: datetime, end_time: datetime):
-    db_path = hass.config.path(
-        "custom_components", "your_integration_name", DATABASE_FILENAME
-    )
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def is_charge_slot_active(hass: HomeAssistant, now: datetime):
+    """Return True while one of the planned 30 minute charge slots is running."""
+    if not hass.data[DOMAIN].get("charging_control_enabled", False):
+        return False
+    for slot in hass.data[DOMAIN].get("slot_times") or []:
+        try:
+            slot_time = datetime.strptime(slot, "%H:%M:%S").time()
+        except (TypeError, ValueError):
+            continue
+        start = datetime.combine(now.date(), slot_time)
+        # A slot starting just before midnight is still running just after it
+        for slot_start in (start, start - timedelta(days=1)):
+            if slot_start <= now < slot_start + timedelta(minutes=30):
+                return True
+    return False
+
+
+class SocCapture:
+    """Store SoC samples when the battery entity changes instead of polling.
+
+    A change is stored once it moves at least the deadband away from the last
+    stored value, and a heartbeat sample keeps flat periods covered. While a
+    charge slot is active every change is stored and the heartbeat drops to
+    a minute so charge transitions are captured with little delay.
+    """
+
+    CHARGING_HEARTBEAT = timedelta(minutes=1)
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entity_id: str,
+        deadband: float,
+        heartbeat: timedelta,
+    ):
+        self._hass = hass
+        self._entity_id = entity_id
+        self._deadband = deadband
+        self._heartbeat = heartbeat
+
+    def async_start(self):
+        """Start listening, returns a callable that stops the capture."""
+        unsub_state = async_track_state_change_event(
+            self._hass, [self._entity_id], self._async_state_changed
+        )
+        unsub_heartbeat = async_track_time_interval(
+            self._hass, self._async_heartbeat, self.CHARGING_HEARTBEAT
+        )
+
+        @callback
+        def stop():
+            unsub_state()
+            unsub_heartbeat()
+
+        return stop
+
+    def _last_sample(self):
+        return self._hass.data[DOMAIN].get("last_soc_sample")
+
+    @callback
+    def _async_state_changed(self, event):
+        new_state = event.data.get("new_state")
+        if new_state is None:
+            return
+        try:
+            soc = float(new_state.state)
+        except ValueError:
+            return
 
-    cursor.execute(
-        "SELECT timestamp, soc FROM soc_data WHERE timestamp BETWEEN ? AND ?",
-        (start_time, end_time),
-    )
-    data = cursor.fetchall()
-    conn.close()
+        last_sample = self._last_sample()
+        charging = is_charge_slot_active(self._hass, datetime.now())
+        if last_sample is None or (
+            soc != last_sample[1]
+            and (charging or abs(soc - last_sample[1]) >= self._deadband)
+        ):
+            insert_soc_data(self._hass, soc, new_state.last_updated)
 
-    return data
+    async def _async_heartbeat(self, now):
+        last_sample = self._last_sample()
+        heartbeat = (
+            self.CHARGING_HEARTBEAT
+            if is_charge_slot_active(self._hass, datetime.now())
+            else self._heartbeat
+        )
+        # Leave a little slack so a heartbeat due on this tick isn't skipped
+        due = heartbeat.total_seconds() - 5
+        if last_sample is None or now.timestamp() - last_sample[0] >= due:
+            await collect_soc_data(self._hass)
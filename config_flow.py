@@ -3,10 +3,36 @@
 import logging
 import voluptuous as vol
 from homeassistant import config_entries, core
-from .const import DOMAIN, set_api_key_and_account
+from .const import (
+    DOMAIN,
+    CONF_HISTORY_BACKEND,
+    CONF_RAW_RETENTION_DAYS,
+    CONF_SOC_DEADBAND,
+    CONF_SOC_FLUSH_MINUTES,
+    CONF_SOC_FLUSH_SAMPLES,
+    CONF_SOC_HEARTBEAT_MINUTES,
+    CONF_SOC_STORAGE_MODE,
+    CONF_SOC_SYNCHRONOUS,
+    CONF_TARIFF_CACHE_HOURS,
+    DEFAULT_HISTORY_BACKEND,
+    DEFAULT_RAW_RETENTION_DAYS,
+    DEFAULT_SOC_DEADBAND,
+    DEFAULT_SOC_FLUSH_MINUTES,
+    DEFAULT_SOC_FLUSH_SAMPLES,
+    DEFAULT_SOC_HEARTBEAT_MINUTES,
+    DEFAULT_SOC_STORAGE_MODE,
+    DEFAULT_SOC_SYNCHRONOUS,
+    DEFAULT_TARIFF_CACHE_HOURS,
+    SOC_SYNCHRONOUS_LEVELS,
+    STORAGE_MODE_CHANGE,
+    STORAGE_MODE_SAMPLE,
+    HISTORY_BACKEND_ARCHIVE,
+    HISTORY_BACKEND_SQLITE,
+    set_api_key_and_account,
+)
 import json
 import os
-import aiohttp
+from .octopus_client import create_octopus_client
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -65,16 +91,16 @@ class BatteryAutomationConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 f"battery_charge_rate is an integer: {isinstance(battery_charge_rate, int)}"
             )
 
-            async with aiohttp.ClientSession() as session:
-                if await validate_api_key(session, api_key, account_id):
-                    set_api_key_and_account(api_key, account_id)
-                    return self.async_create_entry(
-                        title="Battery Automation", data=user_input
-                    )
-                else:
-                    errors = {
-                        "base": translations.get("config.step.user.errors.invalid_key")
-                    }
+            client = create_octopus_client(self.hass, api_key)
+            if await validate_api_key(client, account_id):
+                set_api_key_and_account(api_key, account_id)
+                return self.async_create_entry(
+                    title="Battery Automation", data=user_input
+                )
+            else:
+                errors = {
+                    "base": translations.get("config.step.user.errors.invalid_key")
+                }
         else:
             errors = None
 
@@ -90,6 +116,34 @@ class BatteryAutomationConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     vol.Optional("ac_charge"): vol.In(ac_charge),
                     vol.Optional("charge_start"): vol.In(charge_start),
                     vol.Optional("charge_end"): vol.In(charge_end),
+                    vol.Optional(
+                        CONF_RAW_RETENTION_DAYS, default=DEFAULT_RAW_RETENTION_DAYS
+                    ): vol.All(int, vol.Range(min=1)),
+                    vol.Optional(
+                        CONF_SOC_DEADBAND, default=DEFAULT_SOC_DEADBAND
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_SOC_HEARTBEAT_MINUTES,
+                        default=DEFAULT_SOC_HEARTBEAT_MINUTES,
+                    ): vol.All(int, vol.Range(min=1)),
+                    vol.Optional(
+                        CONF_SOC_STORAGE_MODE, default=DEFAULT_SOC_STORAGE_MODE
+                    ): vol.In([STORAGE_MODE_SAMPLE, STORAGE_MODE_CHANGE]),
+                    vol.Optional(
+                        CONF_SOC_FLUSH_MINUTES, default=DEFAULT_SOC_FLUSH_MINUTES
+                    ): vol.All(int, vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_SOC_FLUSH_SAMPLES, default=DEFAULT_SOC_FLUSH_SAMPLES
+                    ): vol.All(int, vol.Range(min=1)),
+                    vol.Optional(
+                        CONF_SOC_SYNCHRONOUS, default=DEFAULT_SOC_SYNCHRONOUS
+                    ): vol.In(SOC_SYNCHRONOUS_LEVELS),
+                    vol.Optional(
+                        CONF_HISTORY_BACKEND, default=DEFAULT_HISTORY_BACKEND
+                    ): vol.In([HISTORY_BACKEND_SQLITE, HISTORY_BACKEND_ARCHIVE]),
+                    vol.Optional(
+                        CONF_TARIFF_CACHE_HOURS, default=DEFAULT_TARIFF_CACHE_HOURS
+                    ): vol.All(int, vol.Range(min=1)),
                 }
             ),
             errors=errors,
@@ -103,13 +157,10 @@ class BatteryAutomationConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         return True
 
 
-async def validate_api_key(session, api_key, account_id):
+async def validate_api_key(client, account_id):
     try:
-        url = f"https://api.octopus.energy/v1/accounts/{account_id}/"
-        async with session.get(url, auth=aiohttp.BasicAuth(api_key, "")) as response:
-            response.raise_for_status()
-            data = await response.json()
-            return True
+        await client.async_get_account(account_id)
+        return True
     except Exception as e:
         _LOGGER.error(f"Error validating API key: {e}")
         return False
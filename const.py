@@ -27,6 +27,38 @@ def set_battery_capacity(battery_capacity_ah):
     battery_capacity = battery_capacity_ah
 
 
+# Optional config entry settings and their defaults
+CONF_RAW_RETENTION_DAYS = "raw_retention_days"
+DEFAULT_RAW_RETENTION_DAYS = 7
+CONF_SOC_DEADBAND = "soc_deadband"
+DEFAULT_SOC_DEADBAND = 1.0
+CONF_SOC_HEARTBEAT_MINUTES = "soc_heartbeat_minutes"
+DEFAULT_SOC_HEARTBEAT_MINUTES = 15
+CONF_SOC_STORAGE_MODE = "soc_storage_mode"
+# "sample" stores deadbanded samples, "change" stores only value changes plus
+# the heartbeat as a keepalive and reads the history as a step function
+STORAGE_MODE_SAMPLE = "sample"
+STORAGE_MODE_CHANGE = "change"
+DEFAULT_SOC_STORAGE_MODE = STORAGE_MODE_SAMPLE
+# Samples are committed together every so many minutes or samples, 0 minutes
+# commits each sample as it is stored
+CONF_SOC_FLUSH_MINUTES = "soc_flush_minutes"
+DEFAULT_SOC_FLUSH_MINUTES = 5
+CONF_SOC_FLUSH_SAMPLES = "soc_flush_samples"
+DEFAULT_SOC_FLUSH_SAMPLES = 30
+CONF_SOC_SYNCHRONOUS = "soc_synchronous"
+SOC_SYNCHRONOUS_LEVELS = ["OFF", "NORMAL", "FULL"]
+DEFAULT_SOC_SYNCHRONOUS = "NORMAL"
+CONF_HISTORY_BACKEND = "history_backend"
+# "archive" also appends every sample to compact monthly binary files and
+# serves history reads from them, SQLite keeps the rollups
+HISTORY_BACKEND_SQLITE = "sqlite"
+HISTORY_BACKEND_ARCHIVE = "archive"
+DEFAULT_HISTORY_BACKEND = HISTORY_BACKEND_SQLITE
+# Hours the Octopus account's tariff agreements are cached for
+CONF_TARIFF_CACHE_HOURS = "tariff_cache_hours"
+DEFAULT_TARIFF_CACHE_HOURS = 24
+
 unique_id_battery_sensor = "battery_sensor"
 unique_id_charge_plan_sensor = "charge_plan_sensor"
 unique_id_charging_control_switch = "charge_control_switch"
@@ -36,3 +68,5 @@ unique_id_average_battery_usage = "average_battery_usage"
 unique_id_battery_predicitons = "battery_prediciton_sensor"
 unique_id_peak_hours = "[peak_hours]"
 unique_id_lookback = "lookback"
+unique_id_backfill_progress = "soc_backfill_progress"
+unique_id_soc_forecast = "soc_forecast"
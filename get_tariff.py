@@ -1,145 +1,137 @@
-import requests
-import json
-import asyncio
-from datetime import datetime, timedelta
 import logging
-from .const import get_api_key_and_account
+import time
+from datetime import datetime, timedelta, timezone
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
-_LOGGER.info("Starting get tariff")
-
-
-async def get_tariff(api_key, account_id):
-    try:
-        # Get API key and account ID from global constants
-        api_key, account_id = get_api_key_and_account()
-        # _LOGGER.info("API key for get_tariff call: %s", api_key)
-        url = f"https://api.octopus.energy/v1/accounts/{account_id}/"
-
-        # Use asyncio.to_thread to perform the blocking call in a separate thread
-        response = await asyncio.to_thread(requests.get, url, auth=(api_key, ""))
-        response.raise_for_status()
-        data = response.json()["properties"]
-        #_LOGGER.info(f'account data {data}')
-        agreements_list = []
-
-        for properties_item in data:
-            electricity_meter_points = properties_item.get(
-                "electricity_meter_points", []
-            )
-
-            for meter_point in electricity_meter_points:
-                agreements = meter_point.get("agreements", [])
-
-                for agreement in agreements:
-                    tariff = agreement.get("tariff_code")
-                    valid_from = agreement.get("valid_from")
-                    valid_to = agreement.get("valid_to")
-                    is_export = meter_point.get("is_export", False)
-
-                    agreements_dict = {
-                        "tariff": tariff,
-                        "valid_from": valid_from,
-                        "valid_to": valid_to,
-                        "is_export": is_export,
-
-                    }
-                    agreements_list.append(agreements_dict)
-
-        # Extracting import tariffs and their product codes
-        tariff_import = [
-            item["tariff"]
-            for item in agreements_list
-            if item["valid_to"] is None and not item["is_export"]
-        ]
-        # _LOGGER.info("get tariff logger import: %s", tariff_import)
-        if not tariff_import:
-            _LOGGER.warning("No import tariff available.")
-            return None, None
-
-        product_code_import = [
-            "-".join(tariff.split("-")[2:-1]) for tariff in tariff_import
-        ]
-                # Extracting import tariffs and their product codes
-
+STORAGE_KEY = f"{DOMAIN}.tariffs"
+STORAGE_VERSION = 1
 
-        # _LOGGER.info("get tariff logger import: %s", tariff_import)
-        # _LOGGER.debug("tariff_import: %s", tariff_import)
-        # _LOGGER.debug("product_code_import: %s", product_code_import)
+_LOGGER.info("Starting get tariff")
 
-        # Return only the import tariffs and their product codes
-        return tariff_import, product_code_import
 
-    except Exception as e:
-        _LOGGER.error(f"Error retrieving tariff: {e}", exc_info=True)
+async def fetch_account_agreements(client, account_id):
+    """Return the account's electricity agreements from one account request."""
+    data = (await client.async_get_account(account_id))["properties"]
+    # _LOGGER.info(f'account data {data}')
+    agreements_list = []
+
+    for properties_item in data:
+        electricity_meter_points = properties_item.get("electricity_meter_points", [])
+
+        for meter_point in electricity_meter_points:
+            agreements = meter_point.get("agreements", [])
+
+            for agreement in agreements:
+                agreements_dict = {
+                    "tariff": agreement.get("tariff_code"),
+                    "valid_from": agreement.get("valid_from"),
+                    "valid_to": agreement.get("valid_to"),
+                    "is_export": meter_point.get("is_export", False),
+                }
+                agreements_list.append(agreements_dict)
+
+    return agreements_list
+
+
+def parse_agreement_time(value):
+    """Return an aware datetime for an agreement bound, or None if open ended."""
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def select_tariffs(agreements_list, is_export, now=None):
+    """Return (tariff codes, product codes) of the import or export agreements in force."""
+    now = datetime.now(timezone.utc) if now is None else now
+    tariffs = []
+    for item in agreements_list:
+        valid_from = parse_agreement_time(item["valid_from"])
+        valid_to = parse_agreement_time(item["valid_to"])
+        if (
+            item["is_export"] == is_export
+            and (valid_from is None or valid_from <= now)
+            and (valid_to is None or now < valid_to)
+        ):
+            tariffs.append(item["tariff"])
+    if not tariffs:
+        _LOGGER.warning(f"No {'export' if is_export else 'import'} tariff available.")
         return None, None
-    finally:
-        _LOGGER.info("get import tariff finished")
 
-async def get_export_tariff(api_key, account_id):
+    product_codes = ["-".join(tariff.split("-")[2:-1]) for tariff in tariffs]
+    return tariffs, product_codes
+
+
+class TariffCache:
+    """Account agreements per account id, kept in .storage for a TTL.
+
+    Agreements change a few times a year, so routine rate refreshes skip the
+    account request. An entry is refetched once the TTL is up, when one of
+    its agreements starts or ends, or when forced after a rates request was
+    refused.
+    """
+
+    def __init__(self, hass: HomeAssistant, ttl: timedelta):
+        self._ttl = ttl.total_seconds()
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        # account id -> {"fetched_at": epoch seconds, "agreements": [...]}
+        self._accounts = {}
+
+    async def async_load(self):
+        self._accounts = await self._store.async_load() or {}
+
+    def _is_fresh(self, entry, now):
+        if now - entry["fetched_at"] >= self._ttl:
+            return False
+        fetched_at = datetime.fromtimestamp(entry["fetched_at"], timezone.utc)
+        current = datetime.fromtimestamp(now, timezone.utc)
+        for item in entry["agreements"]:
+            for bound in (item["valid_from"], item["valid_to"]):
+                moment = parse_agreement_time(bound)
+                if moment is not None and fetched_at < moment <= current:
+                    return False
+        return True
+
+    async def async_get_agreements(self, client, account_id, force=False):
+        """Return the account's agreements, fetching them when stale or forced."""
+        now = time.time()
+        entry = self._accounts.get(account_id)
+        if entry is not None and not force and self._is_fresh(entry, now):
+            return entry["agreements"]
+        agreements_list = await fetch_account_agreements(client, account_id)
+        self._accounts[account_id] = {"fetched_at": now, "agreements": agreements_list}
+        await self._store.async_save(self._accounts)
+        _LOGGER.info(f"Refreshed cached tariffs for account {account_id}")
+        return agreements_list
+
+
+async def get_tariffs(client, account_id, tariff_cache=None, force=False):
+    """Return (import, export) (tariff codes, product codes) from one account fetch.
+
+    With a tariff_cache the agreements come from it while they are fresh.
+    """
     try:
-        # Get API key and account ID from global constants
-        api_key, account_id = get_api_key_and_account()
-        # _LOGGER.info("API key for get_tariff call: %s", api_key)
-        url = f"https://api.octopus.energy/v1/accounts/{account_id}/"
-
-        # Use asyncio.to_thread to perform the blocking call in a separate thread
-        response = await asyncio.to_thread(requests.get, url, auth=(api_key, ""))
-        response.raise_for_status()
-        data = response.json()["properties"]
-
-        agreements_list = []
-
-        for properties_item in data:
-            electricity_meter_points = properties_item.get(
-                "electricity_meter_points", []
+        if tariff_cache is None:
+            agreements_list = await fetch_account_agreements(client, account_id)
+        else:
+            agreements_list = await tariff_cache.async_get_agreements(
+                client, account_id, force
             )
-
-            for meter_point in electricity_meter_points:
-                agreements = meter_point.get("agreements", [])
-
-                for agreement in agreements:
-                    tariff = agreement.get("tariff_code")
-                    valid_from = agreement.get("valid_from")
-                    valid_to = agreement.get("valid_to")
-                    is_export = meter_point.get("is_export", True)
-
-                    agreements_dict = {
-                        "tariff": tariff,
-                        "valid_from": valid_from,
-                        "valid_to": valid_to,
-                        "is_export": is_export,
-
-                    }
-                    agreements_list.append(agreements_dict)
-
-        # Extracting import tariffs and their product codes
-        tariff_export = [
-            item["tariff"]
-            for item in agreements_list
-            if item["valid_to"] is None and item["is_export"]
-        ]
-        # _LOGGER.info("get tariff logger import: %s", tariff_import)
-        if not tariff_export:
-            _LOGGER.warning("No import tariff available.")
-            return None, None
-
-        product_code_export = [
-            "-".join(tariff.split("-")[2:-1]) for tariff in tariff_export
-        ]
-        #_LOGGER.info(f'Export tariff {tariff_export}, product code export {product_code_export}')
-                # Extracting import tariffs and their product codes
-
-
-        # _LOGGER.info("get tariff logger import: %s", tariff_import)
-        # _LOGGER.debug("tariff_import: %s", tariff_import)
-        # _LOGGER.debug("product_code_import: %s", product_code_import)
-        # Return only the import tariffs and their product codes
-        return tariff_export, product_code_export
-
+        return (
+            select_tariffs(agreements_list, False),
+            select_tariffs(agreements_list, True),
+        )
     except Exception as e:
         _LOGGER.error(f"Error retrieving tariff: {e}", exc_info=True)
-        return None, None
+        return (None, None), (None, None)
     finally:
-        _LOGGER.info("get export tariff finished")
\ No newline at end of file
+        _LOGGER.info("get tariffs finished")
+
+
+def get_tariff_cache(hass: HomeAssistant):
+    """Return the shared tariff cache, or None before it is set up."""
+    return hass.data.get(DOMAIN, {}).get("tariff_cache")
@@ -1,9 +1,11 @@
 # octopus_api.py
-import aiohttp
-import asyncio
 import logging
-from datetime import datetime, timedelta
-from .get_tariff import get_tariff, get_export_tariff
+from aiohttp import ClientResponseError
+from datetime import datetime, time, timedelta
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+from .get_tariff import get_tariffs
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -13,186 +15,183 @@ rates_data = {}
 # rates_data['last_update'] = datetime.now()
 
 
-async def get_octopus_energy_rates(api_key, account_id, rate_type):
+STORAGE_KEY = f"{DOMAIN}.rates"
+STORAGE_VERSION = 1
+
+# Octopus publishes the next day's rates by about this time each day
+RATES_PUBLISHED_AT = time(16, 0)
+
+# Every view built from one unit-rates fetch, as keys of rates_data
+RATE_VIEWS = (
+    "rates_from_midnight",
+    "afternoon_today",
+    "evening_today",
+    "afternoon_tomorrow",
+    "all_rates",
+    "current_import_rate",
+    "rates_left",
+)
+
+
+async def fetch_unit_rates(client, account_id, tariff_cache=None):
+    """Return the raw import unit rates for today and tomorrow, or None on failure.
+
+    The tariff comes from one account fetch, or the tariff cache. A rates
+    request refused with a 4xx refreshes a cached tariff and retries.
+    """
     current_day = datetime.now()
-    tomorrow = current_day + timedelta(days=1)
-    current_day_str = current_day.strftime("%d-%m-%Y")
-    tomorrow_str = tomorrow.strftime("%d-%m-%Y")
+    # Today 00:00 through the end of tomorrow, the furthest rates published
+    period_from = datetime.combine(current_day.date(), time())
+    period_to = period_from + timedelta(days=2)
 
-    # Retrieve product codes using get_tariff function
-    product_code_import, tariff_import = await get_tariff(api_key, account_id)
-    product_code_export, tariff_export = await get_export_tariff(api_key, account_id)
+    for force in (False, True):
+        (tariff_import, product_code_import), _ = await get_tariffs(
+            client, account_id, tariff_cache, force
+        )
 
-    if not product_code_import or not tariff_import:
-        _LOGGER.error("Failed to get tariff information.")
-        return None
+        if not product_code_import or not tariff_import:
+            _LOGGER.error("Failed to get tariff information.")
+            return None
+
+        try:
+            rates_import = await client.async_get_unit_rates(
+                "-".join(product_code_import),
+                "-".join(tariff_import),
+                period_from,
+                period_to,
+            )
+            break
+        except ClientResponseError as e:
+            if force or tariff_cache is None or not 400 <= e.status < 500:
+                _LOGGER.error(f"Error fetching Octopus Energy rates: {e}")
+                return None
+            _LOGGER.warning(
+                f"Rates request refused with {e.status}, refreshing the cached tariff"
+            )
+        except Exception as e:
+            _LOGGER.error(f"Error fetching Octopus Energy rates: {e}")
+            return None
 
-    i_import = "-".join(product_code_import)
-    c_import = "-".join(tariff_import)
-    c_export = "-".join(tariff_export)
-    i_export = "-".join(product_code_export)
-
-    url_import = f"https://api.octopus.energy/v1/products/{c_import}/electricity-tariffs/{i_import}/standard-unit-rates/"
-    # _LOGGER.info(f'import url: {url_import}')
-    url_export = f"https://api.octopus.energy/v1/products/{c_export}/electricity-tariffs/{i_export}/standard-unit-rates/"
-    #_LOGGER.info(f"import url: {url_export}")
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url_import) as response:
-                response.raise_for_status()
-                data = await response.json()
-                rates_import = data["results"]
-
-                # Process and store rates
-                process_and_store_rates(
-                    rates_import,
-                    rate_type,
-                    current_day,
-                    tomorrow,
-                    current_day_str,
-                    tomorrow_str,
-                )
-    except Exception as e:
-        _LOGGER.error(f"Error fetching Octopus Energy rates: {e}")
+    return rates_import
+
+
+async def get_octopus_energy_rates(client, account_id, tariff_cache=None):
+    """Return {view: rates} for every RATE_VIEWS entry, or None on failure.
+
+    The unit rates are fetched once and every view is derived from them.
+    """
+    rates_import = await fetch_unit_rates(client, account_id, tariff_cache)
+    if rates_import is None:
         return None
+    return store_rate_views(rates_import)
+
 
-    # Return the requested rates data
-    return rates_data.get(rate_type)
+def store_rate_views(rates_import):
+    """Build every view for the current day and keep them in rates_data."""
+    current_day = datetime.now()
+    tomorrow = current_day + timedelta(days=1)
+    views = build_rate_views(rates_import, current_day, tomorrow)
+    rates_data.update(views)
+    return views
 
 
-def process_and_store_rates(
-    rates_import, rate_type, current_day, tomorrow, current_day_str, tomorrow_str
-):
-    rates_list = []
+def rates_are_stale(fetched_at: datetime, now=None):
+    """Return True if rates have been published since fetched_at."""
+    now = datetime.now() if now is None else now
+    published = datetime.combine(now.date(), RATES_PUBLISHED_AT)
+    if now < published:
+        published -= timedelta(days=1)
+    return fetched_at < published
 
-    for item in rates_import:
-        value = item["value_inc_vat"]
-        valid_from = item["valid_from"]
-        valid_till = item["valid_to"]
 
-        valid_till_dt = datetime.fromisoformat(valid_till)
-        valid_from_dt = datetime.fromisoformat(valid_from)
+class RatesStore:
+    """The last fetched unit rates in .storage, so restarts have rates at once.
+
+    The raw rates are kept and the views rebuilt on load, so they follow the
+    current day even when Octopus can't be reached.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
 
-        valid_till_formatted = valid_till_dt.strftime("%H:%M:%S")
-        valid_from_formatted = valid_from_dt.strftime("%H:%M:%S")
-        date_formatted = valid_from_dt.strftime("%d-%m-%Y")
+    async def async_load(self):
+        """Return (raw rates, fetch time) or (None, None) without a saved copy."""
+        data = await self._store.async_load()
+        if not data:
+            return None, None
+        return data["rates"], datetime.fromisoformat(data["fetched_at"])
 
+    async def async_save(self, rates_import, fetched_at: datetime):
+        await self._store.async_save(
+            {"rates": rates_import, "fetched_at": fetched_at.isoformat()}
+        )
+
+
+def build_rate_views(rates_import, current_day, tomorrow):
+    """Return {view: rates} for every RATE_VIEWS entry in one pass over the rates."""
+    now = datetime.now()
+    current_day_str = current_day.strftime("%d-%m-%Y")
+    tomorrow_str = tomorrow.strftime("%d-%m-%Y")
+    views = {view: [] for view in RATE_VIEWS}
+    current_rate = None
+
+    for item in rates_import:
+        valid_from_dt = datetime.fromisoformat(item["valid_from"])
+        valid_till_dt = datetime.fromisoformat(item["valid_to"])
         rates_dict = {
-            "Cost": str(value) + "p",
-            "Date": date_formatted,
-            "Start Time": valid_from_formatted,
-            "End Time": valid_till_formatted,
+            "Cost": str(item["value_inc_vat"]) + "p",
+            "Date": valid_from_dt.strftime("%d-%m-%Y"),
+            "Start Time": valid_from_dt.strftime("%H:%M:%S"),
+            "End Time": valid_till_dt.strftime("%H:%M:%S"),
         }
-        rates_list.append(rates_dict)
-
-    sorted_rates = sorted(rates_list, key=lambda k: k["Start Time"])
-    sorted_by_date = sorted(
-        rates_list,
-        key=lambda d: (
-            datetime.strptime(d["Date"], "%d-%m-%Y"),
-            datetime.strptime(d["Start Time"], "%H:%M:%S"),
-        ),
-    )
-    # _LOGGER.info("rates list: %s", list)
-    if rate_type == "rates_from_midnight":
-        rates_data["rates_from_midnight"] = [
-            item
-            for item in sorted_rates
-            if item_meets_condition(item, "00:00:00", "08:00:00", current_day, tomorrow)
-        ]
-        # _LOGGER.info(f"Rates from midnight: {rates_data['rates_from_midnight']}")  # Log specific rate data
-        return
-
-    elif rate_type == "afternoon_today":
-        rates_data["afternoon_today"] = [
-            item
-            for item in sorted_rates
-            if item_meets_condition(item, "12:00:00", "16:00:00", current_day)
-        ]
-        _LOGGER.info(f"Afternoon Rates today: {rates_data['afternoon_today']}")
-        return
-    elif rate_type == "evening_today":
-        rates_data["evening_today"] = [
-            item
-            for item in sorted_rates
-            if item_meets_condition(item, "19:00:00", "23:59:59", current_day)
-        ]
-        _LOGGER.info(f"evening today: {rates_data['evening_today']}")
-        return
-
-    elif rate_type == "afternoon_tomorrow":
-        rates_data["afternoon_tomorrow"] = [
-            item
-            for item in sorted_rates
-            if item_meets_condition(item, "12:00:00", "16:00:00", tomorrow)
-        ]
-        # _LOGGER.info(f"Rates Afternoon Tomorrow: {rates_data['afternoon_tomorrow']}")
-        return
-    elif rate_type == "all_rates":
-        rates_data["all_rates"] = [
-            item
-            for item in sorted_by_date
-            if item["Date"]
-            in [
-                current_day_str,
-                tomorrow_str,
-            ]
-        ]
-        return
-    elif rate_type == "current_import_rate":
-        now = datetime.now()
-        current_rate = next(
-            (
-                item
-                for item in sorted_by_date
-                if now
-                >= datetime.strptime(
-                    item["Date"] + " " + item["Start Time"], "%d-%m-%Y %H:%M:%S"
-                )
-                and now
-                < datetime.strptime(
-                    item["Date"] + " " + item["End Time"], "%d-%m-%Y %H:%M:%S"
-                )
-            ),
-            None,
+        # Parsed once, the views below compare these
+        start = datetime.strptime(
+            rates_dict["Date"] + " " + rates_dict["Start Time"], "%d-%m-%Y %H:%M:%S"
         )
-        rates_data["current_import_rate"] = [current_rate] if current_rate else []
-        _LOGGER.info(f"current import: {rates_data['current_import_rate']}")
-        return
-
-    elif rate_type == "rates_left":
-        now = datetime.now()
-        future_rates = [
-            item
-            for item in sorted_by_date
-            if now
-            < datetime.strptime(
-                item["Date"] + " " + item["End Time"], "%d-%m-%Y %H:%M:%S"
-            )
-        ]
-        future_rates_sorted = sorted(
-            future_rates,
-            key=lambda x: datetime.strptime(
-                x["Date"] + " " + x["Start Time"], "%d-%m-%Y %H:%M:%S"
-            ),
+        end = datetime.strptime(
+            rates_dict["Date"] + " " + rates_dict["End Time"], "%d-%m-%Y %H:%M:%S"
         )
-        rates_data["rates_left"] = future_rates_sorted
-        return
-        # Add other rate types as needed
-    _LOGGER.info("rates data:%s", rates_data)
-
-
-def item_meets_condition(item, start_time, end_time, current_day, tomorrow=None):
+        entry = (start, rates_dict)
+
+        if in_window(start, "00:00:00", "08:00:00", current_day, tomorrow):
+            views["rates_from_midnight"].append(entry)
+        if in_window(start, "12:00:00", "16:00:00", current_day):
+            views["afternoon_today"].append(entry)
+        if in_window(start, "19:00:00", "23:59:59", current_day):
+            views["evening_today"].append(entry)
+        if in_window(start, "12:00:00", "16:00:00", tomorrow):
+            views["afternoon_tomorrow"].append(entry)
+        if rates_dict["Date"] in (current_day_str, tomorrow_str):
+            views["all_rates"].append(entry)
+        if start <= now < end and (current_rate is None or start < current_rate[0]):
+            current_rate = entry
+        if now < end:
+            views["rates_left"].append(entry)
+
+    # Window views are ordered by time of day, the rest by date and time
+    for view, rates in views.items():
+        if view in ("all_rates", "rates_left"):
+            rates.sort(key=lambda entry: entry[0])
+        else:
+            rates.sort(key=lambda entry: entry[1]["Start Time"])
+        views[view] = [rates_dict for _, rates_dict in rates]
+    views["current_import_rate"] = [current_rate[1]] if current_rate else []
+
+    _LOGGER.info(f"Afternoon Rates today: {views['afternoon_today']}")
+    _LOGGER.info(f"evening today: {views['evening_today']}")
+    _LOGGER.info(f"current import: {views['current_import_rate']}")
+    return views
+
+
+def in_window(start, start_time, end_time, current_day, tomorrow=None):
+    """Return True if start falls between the two times on either day."""
     if tomorrow is None:
         tomorrow = current_day
-    item_date_time = datetime.strptime(
-        item["Date"] + " " + item["Start Time"], "%d-%m-%Y %H:%M:%S"
-    )
     return any(
         datetime.combine(day, datetime.strptime(start_time, "%H:%M:%S").time())
-        <= item_date_time
+        <= start
         <= datetime.combine(day, datetime.strptime(end_time, "%H:%M:%S").time())
-        for day in [current_day, tomorrow]
+        for day in (current_day, tomorrow)
     )
 
 
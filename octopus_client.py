@@ -0,0 +1,100 @@
+"""Async client for the Octopus Energy API on Home Assistant's shared session."""
+# octopus_client.py
+import asyncio
+import math
+from datetime import timezone
+import aiohttp
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from .const import DOMAIN
+
+API_BASE_URL = "https://api.octopus.energy/v1"
+
+# Per request, so one slow call can't hold up a refresh indefinitely
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
+
+# The API's largest page, two days of half-hourly rates fit in one
+UNIT_RATES_PAGE_SIZE = 1500
+
+
+class OctopusClient:
+    """All Octopus API requests, sharing HA's pooled keep-alive connections.
+
+    Responses are requested gzip compressed and raise aiohttp.ClientError or
+    asyncio.TimeoutError on failure.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, api_key):
+        self._session = session
+        self._auth = aiohttp.BasicAuth(api_key, "")
+
+    async def async_get(self, url, params=None):
+        """Return the decoded JSON of a GET on a full URL or an API path."""
+        if not url.startswith("https://"):
+            url = f"{API_BASE_URL}/{url}"
+        async with self._session.get(
+            url,
+            params=params,
+            auth=self._auth,
+            headers={"Accept-Encoding": "gzip"},
+            timeout=REQUEST_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def async_get_account(self, account_id):
+        return await self.async_get(f"accounts/{account_id}/")
+
+    async def async_get_unit_rates(
+        self, product_code, tariff_code, period_from, period_to
+    ):
+        """Return every unit rate valid between two datetimes.
+
+        Pages after the first are fetched concurrently when the results don't
+        fit on one.
+        """
+        path = (
+            f"products/{product_code}/electricity-tariffs/{tariff_code}/"
+            "standard-unit-rates/"
+        )
+        params = {
+            "period_from": format_period(period_from),
+            "period_to": format_period(period_to),
+            "page_size": UNIT_RATES_PAGE_SIZE,
+        }
+        data = await self.async_get(path, params)
+        results = list(data["results"])
+        if not data.get("next"):
+            return results
+
+        count = data.get("count")
+        if count is None:
+            # Without a count the pages can only be followed one by one
+            while data.get("next"):
+                data = await self.async_get(data["next"])
+                results.extend(data["results"])
+            return results
+        pages = await asyncio.gather(
+            *(
+                self.async_get(path, {**params, "page": page})
+                for page in range(2, math.ceil(count / UNIT_RATES_PAGE_SIZE) + 1)
+            )
+        )
+        for page in pages:
+            results.extend(page["results"])
+        return results
+
+
+def format_period(moment):
+    """Return a datetime as the UTC ISO 8601 string the API filters on."""
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def create_octopus_client(hass: HomeAssistant, api_key):
+    """Return a client on the shared session, e.g. to validate a new API key."""
+    return OctopusClient(async_get_clientsession(hass), api_key)
+
+
+def get_octopus_client(hass: HomeAssistant):
+    """Return the integration's client, or None before it is set up."""
+    return hass.data.get(DOMAIN, {}).get("octopus_client")
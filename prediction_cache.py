@@ -0,0 +1,51 @@
+"""LRU cache of fitted SoC models and other per-version results."""
+# prediction_cache.py
+import threading
+from collections import OrderedDict
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN
+
+# Entries kept before the least recently used is evicted
+PREDICTION_CACHE_SIZE = 128
+
+
+class PredictionCache:
+    """Results keyed by (model type, lookback, data version, variant).
+
+    The data version only changes when a new SoC sample is stored, so sensor
+    refreshes between samples reuse the fit. Anything that depends on the
+    current time is computed from the cached value on each call. Old versions
+    are never asked for again and age out through the LRU eviction.
+    """
+
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        # Executor threads share the cache
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_prediction_cache(hass: HomeAssistant):
+    """Return the shared prediction cache, creating it on first use."""
+    return hass.data[DOMAIN].setdefault("prediction_cache", PredictionCache())
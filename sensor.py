@@ -9,7 +9,10 @@ from .sensors.battery_storage_sensor import BatteryStorageSensors
 from .sensors.battery_charge_plan_sensor import BatteryChargePlanSensor
 from .sensors.average_battery_usage import AverageBatteryUsageSensor
 from .sensors.battery_prediction_sensor import BatteryPredictionSensor
+from .battery_predictions import MODEL_PROFILE, MODEL_STREAMING
 from .sensors.peak_hours import PeakHours
+from .sensors.backfill_progress_sensor import BackfillProgressSensor
+from .sensors.soc_forecast_sensor import SocForecastSensor
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -81,6 +84,7 @@ async def async_setup_entry(hass, entry, async_add_entities):
         BatteryStorageSensors("Battery Kwh", "battery_capacity_kwh"),
         BatteryChargePlanSensor("Battery Charge Plan"),
         ChargingStatusSensor("Charging Status"),  # Add the charging status sensor
+        BackfillProgressSensor(hass, "SoC Backfill Progress"),
     ]
 
     # Create sensors for average usage
@@ -103,19 +107,47 @@ async def async_setup_entry(hass, entry, async_add_entities):
             hass, "Total charge Last Hour Charge", timedelta(hours=1), "charge"
         ),
         AverageBatteryUsageSensor(
-            hass, "Total charge Last 12 Hours Charge", timedelta(hours=12), "total"
+            hass,
+            "Total charge Last 12 Hours Charge",
+            timedelta(hours=12),
+            "total_charge",
         ),
         AverageBatteryUsageSensor(
-            hass, "Total charge Last 24 Hours Charge", timedelta(hours=24), "total"
+            hass,
+            "Total charge Last 24 Hours Charge",
+            timedelta(hours=24),
+            "total_charge",
         ),
         AverageBatteryUsageSensor(
-            hass, "Total charge Last 7 Days Charge", timedelta(days=7), "total"
+            hass,
+            "Total charge Last 7 Days Charge",
+            timedelta(days=7),
+            "total_charge",
         ),
     ]
 
     prediction_sensor_entities = [
         BatteryPredictionSensor(hass, "1 Hour Battery Prediction", timedelta(hours=1)),
         BatteryPredictionSensor(hass, "6 Hours Battery Prediction", timedelta(hours=6)),
+        BatteryPredictionSensor(
+            hass, "1 Hour Profile Battery Prediction", timedelta(hours=1), MODEL_PROFILE
+        ),
+        BatteryPredictionSensor(
+            hass, "6 Hours Profile Battery Prediction", timedelta(hours=6), MODEL_PROFILE
+        ),
+        BatteryPredictionSensor(
+            hass,
+            "1 Hour Streaming Battery Prediction",
+            timedelta(hours=1),
+            MODEL_STREAMING,
+        ),
+        BatteryPredictionSensor(
+            hass,
+            "6 Hours Streaming Battery Prediction",
+            timedelta(hours=6),
+            MODEL_STREAMING,
+        ),
+        SocForecastSensor(hass, "SoC Forecast", timedelta(days=1)),
     ]
 
     peak_hour_sensors = [
@@ -142,6 +174,10 @@ async def async_setup_entry(hass, entry, async_add_entities):
     hass.data[DOMAIN]["charging_status_sensor"] = next(
         (sensor for sensor in sensors if isinstance(sensor, ChargingStatusSensor)), None
     )
+    hass.data[DOMAIN]["backfill_progress_sensor"] = next(
+        (sensor for sensor in sensors if isinstance(sensor, BackfillProgressSensor)),
+        None,
+    )
 
     charging_entity_start = entry.data.get("charging_entity_start")
     charging_entity_end = entry.data.get("charging_entity_end")
@@ -1,6 +1,10 @@
 from homeassistant.helpers.entity import Entity
-from datetime import timedelta
-from ..battery_soc_calcs import calculate_average_decline, calculate_average_change
+from ..battery_soc_calcs import (
+    average_change_from_totals,
+    calculate_usage_statistics,
+    total_change_from_totals,
+)
+from ..soc_aggregators import get_soc_aggregators
 from ..battery_predictions import predict_peak_hours_soc
 from ..const import DOMAIN, unique_id_average_battery_usage
 from homeassistant.const import PERCENTAGE, DEVICE_CLASS_BATTERY
@@ -63,11 +67,16 @@ class AverageBatteryUsageSensor(Entity):
             return {"peak_hours_predictions": self._peak_hours_predictions}
         return {}
 
-    async def async_update(self):
-        try:
-            average_charge, average_usage = await self._hass.async_add_executor_job(
-                calculate_average_change, self._hass, self._period
-            )
+    @property
+    def period(self):
+        """Return the trailing window this sensor reports on."""
+        return self._period
+
+    def apply_totals(self, totals):
+        """Set the state from summarise_windows style totals for the period."""
+        if self._mode in ["usage", "charge"]:
+            # For average change calculations
+            average_charge, average_usage = average_change_from_totals(totals)
             if self._mode == "usage":
                 self._state = (
                     average_usage if average_usage is not None else "Not enough data"
@@ -76,12 +85,61 @@ class AverageBatteryUsageSensor(Entity):
                 self._state = (
                     average_charge if average_charge is not None else "Not enough data"
                 )
+        elif self._mode in ["total", "total_charge"]:
+            # For total percentage change calculations, "total" reports the
+            # discharge and "total_charge" the charge
+            total_charge, total_discharge = total_change_from_totals(
+                totals, self._hass.data[DOMAIN]["battery_capacity_kwh"]
+            )
+            total = total_charge if self._mode == "total_charge" else total_discharge
+            self._state = total if total is not None else "Not enough data"
 
+    async def async_update(self):
+        try:
+            # Handling for peak hours predictions
             if self._mode == "peak_hours":
                 self._peak_hours_predictions = await self._hass.async_add_executor_job(
                     predict_peak_hours_soc, self._hass, self._period
                 )
-                # You might want to set some state here or leave it as is
+                # Update state or additional attributes as needed
+                return
+
+            stats = await async_get_usage_statistics(self._hass, [self._period])
+            self.apply_totals(stats[self._period])
         except Exception as e:
             _LOGGER.error(f"Error updating sensor: {e}")
             self._state = "Error"
+
+
+async def async_get_usage_statistics(hass, periods):
+    """Return {period: totals} for all periods in one pass.
+
+    The rolling aggregators answer in O(1) once seeded in the executor,
+    without them a single executor job fetches the longest window once for
+    every period.
+    """
+    aggregators = get_soc_aggregators(hass)
+    if aggregators is not None:
+        return await aggregators.async_totals(periods)
+    return await hass.async_add_executor_job(calculate_usage_statistics, hass, periods)
+
+
+async def async_update_usage_sensors(hass, sensors):
+    """Refresh a batch of usage sensors from one multi-window calculation."""
+    if not sensors:
+        return
+    try:
+        stats = await async_get_usage_statistics(
+            hass, list({sensor.period for sensor in sensors})
+        )
+    except Exception as e:
+        _LOGGER.error(f"Error calculating battery usage statistics: {e}")
+        return
+    for sensor in sensors:
+        try:
+            sensor.apply_totals(stats[sensor.period])
+        except Exception as e:
+            _LOGGER.error(f"Error updating sensor: {e}")
+            sensor._state = "Error"
+        if sensor.hass is not None:
+            sensor.async_write_ha_state()
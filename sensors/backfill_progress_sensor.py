@@ -0,0 +1,66 @@
+import logging
+from homeassistant.helpers.entity import Entity
+from homeassistant.const import PERCENTAGE
+from ..const import DOMAIN, unique_id_backfill_progress
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class BackfillProgressSensor(Entity):
+    """Progress of the SoC history backfill from the recorder, in percent."""
+
+    def __init__(self, hass, name):
+        self._hass = hass
+        self._name = name
+        self._state = None
+        self._status = None
+        self._samples = 0
+        object_id = f"battery_automation_{self._name.lower().replace(' ', '_')}"
+        self.entity_id = f"sensor.{object_id}"
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def unique_id(self):
+        """Return a unique ID to use for this sensor."""
+        return f"{unique_id_backfill_progress}_{self._name}"
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return PERCENTAGE
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        return {"status": self._status, "samples": self._samples}
+
+    @property
+    def device_info(self):
+        """Return information about the device this sensor is part of."""
+        return {
+            "identifiers": {(DOMAIN, "battery_storage_sensors")},
+            "name": "Battery Storage Automation",
+            "manufacturer": "Zakery292",
+        }
+
+    @property
+    def should_poll(self):
+        """Return the polling state."""
+        return False
+
+    async def async_update(self):
+        backfill = self._hass.data[DOMAIN].get("soc_backfill")
+        if backfill is None:
+            return
+        self._state = backfill.progress
+        self._status = backfill.status
+        self._samples = backfill.samples
@@ -1,5 +1,5 @@
 from homeassistant.helpers.entity import Entity
-from ..battery_predictions import predict_future_state
+from ..battery_predictions import MODEL_LINEAR, predict_future_state
 from datetime import timedelta
 from ..const import DOMAIN, unique_id_battery_predicitons
 import logging
@@ -7,11 +7,12 @@ import logging
 _LOGGER = logging.getLogger(__name__)
 
 class BatteryPredictionSensor(Entity):
-    def __init__(self, hass, name, prediction_horizon):
+    def __init__(self, hass, name, prediction_horizon, model_type=MODEL_LINEAR):
         self._hass = hass
         self._name = name
         self._state = None
         self._prediction_horizon = prediction_horizon
+        self._model_type = model_type
         object_id = f"battery_prediction_sensor{self._name.lower().replace(' ', '_')}"
         self.entity_id = f"sensor.{object_id}"
 
@@ -45,7 +46,11 @@ class BatteryPredictionSensor(Entity):
     async def async_update(self):
         lookback_period = timedelta(days=1)  # Adjust as needed
         self._state = await self._hass.async_add_executor_job(
-            predict_future_state, self._hass, self._prediction_horizon, lookback_period
+            predict_future_state,
+            self._hass,
+            self._prediction_horizon,
+            lookback_period,
+            self._model_type,
         )
         self.async_schedule_update_ha_state()
         _LOGGER.info(f'Battery Predicitons 1/6 updated')
@@ -0,0 +1,97 @@
+import logging
+from datetime import datetime
+from homeassistant.helpers.entity import Entity
+from homeassistant.const import PERCENTAGE
+from ..battery_predictions import (
+    MODEL_PROFILE,
+    forecast_slot_times,
+    predict_soc_trajectory,
+)
+from ..soc_history import get_data_version
+from ..const import DOMAIN, unique_id_soc_forecast
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SocForecastSensor(Entity):
+    """Predicted SoC for each of the next 48 half-hour slots.
+
+    The state is the next slot's SoC and the forecast attribute holds the
+    whole trajectory, also kept in hass.data[DOMAIN]["soc_forecast"] for the
+    charge planner. It is only recomputed when new SoC data arrives or the
+    slots move on.
+    """
+
+    def __init__(self, hass, name, lookback_period, model_type=MODEL_PROFILE):
+        self._hass = hass
+        self._name = name
+        self._state = None
+        self._forecast = []
+        self._lookback_period = lookback_period
+        self._model_type = model_type
+        # (data version, first slot) the forecast was computed for
+        self._computed_for = None
+        object_id = f"battery_automation_{self._name.lower().replace(' ', '_')}"
+        self.entity_id = f"sensor.{object_id}"
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def unique_id(self):
+        """Return a unique ID to use for this sensor."""
+        return f"{unique_id_soc_forecast}_{self._name}"
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return PERCENTAGE
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        return {"forecast": self._forecast, "model": self._model_type}
+
+    @property
+    def device_info(self):
+        """Return information about the device this sensor is part of."""
+        return {
+            "identifiers": {(DOMAIN, "battery_storage_sensors")},
+            "name": "Battery Storage Automation",
+            "manufacturer": "Zakery292",
+        }
+
+    @property
+    def should_poll(self):
+        """Return the polling state."""
+        return False
+
+    async def async_update(self):
+        version = get_data_version(self._hass)
+        computed_for = (version, forecast_slot_times(datetime.now(), 1)[0])
+        if version is not None and computed_for == self._computed_for:
+            return
+        try:
+            trajectory = await self._hass.async_add_executor_job(
+                predict_soc_trajectory,
+                self._hass,
+                self._lookback_period,
+                self._model_type,
+            )
+        except Exception as e:
+            _LOGGER.error(f"Error updating SoC forecast: {e}")
+            return
+        self._computed_for = computed_for
+        self._forecast = [
+            {"time": slot_time.isoformat(), "soc": soc} for slot_time, soc in trajectory
+        ]
+        self._state = self._forecast[0]["soc"] if self._forecast else None
+        self._hass.data[DOMAIN]["soc_forecast"] = self._forecast
+        self.async_schedule_update_ha_state()
@@ -0,0 +1,232 @@
+"""Incremental rolling-window SoC change totals."""
+# soc_aggregators.py
+import logging
+import time
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+from .battery_soc_calcs import summarise_windows
+from .soc_segments import CHARGING
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_KEY = f"{DOMAIN}.aggregators"
+STORAGE_VERSION = 1
+
+# Checkpoints are coalesced into one write per this many seconds
+CHECKPOINT_DELAY = 5 * 60
+
+
+class RollingWindowAggregator:
+    """Running totals of SoC increases and decreases over a trailing window.
+
+    Holds the same numbers as summarise_windows over the samples in the
+    window, rises only counted while charging and falls only while not. New
+    samples add their change from the previous sample and samples falling out
+    of the window take their change to the next sample with them, so an
+    update costs O(samples added + samples expired) whatever the period.
+    """
+
+    def __init__(self, period: timedelta, carry_forward=False):
+        self.period = period
+        # Step-function windows keep the sample in force at their start
+        self.carry_forward = carry_forward
+        self.samples = 0
+        self.increase = 0.0
+        self.increases = 0
+        self.decrease = 0.0
+        self.decreases = 0
+        # Oldest and newest sample timestamps folded into the totals
+        self.first_ts = None
+        self.last_ts = None
+
+    def totals(self):
+        """Return (samples, increase, increase count, decrease, decrease count)."""
+        return (
+            self.samples,
+            self.increase,
+            self.increases,
+            self.decrease,
+            self.decreases,
+        )
+
+    def _apply(self, change, label, sign):
+        # Changes are labelled by the sample they lead to
+        if change > 0 and label == CHARGING:
+            self.increase += sign * change
+            self.increases += sign
+        elif change < 0 and label != CHARGING:
+            self.decrease -= sign * change
+            self.decreases += sign
+
+    def needs_seed(self, history):
+        """Return True if the totals can't be advanced from the history."""
+        return self.last_ts is None or not history.covers(self.first_ts)
+
+    def seed(self, totals, timestamps):
+        """Set the totals for a window ending at the last of timestamps."""
+        (
+            self.samples,
+            self.increase,
+            self.increases,
+            self.decrease,
+            self.decreases,
+        ) = totals
+        if self.samples:
+            self.first_ts = timestamps[len(timestamps) - self.samples]
+            self.last_ts = timestamps[len(timestamps) - 1]
+        else:
+            self.first_ts = self.last_ts = None
+
+    def advance(self, history, now):
+        """Fold in samples newer than last_ts and expire those older than the window."""
+        # The newest folded sample comes back first as the predecessor
+        timestamps, socs, labels = history.segments(self.last_ts, now)
+        for i in range(1, len(socs)):
+            self._apply(socs[i] - socs[i - 1], labels[i], 1)
+        self.samples += max(len(socs) - 1, 0)
+        if len(timestamps):
+            self.last_ts = timestamps[-1]
+
+        start = now - self.period.total_seconds()
+        if self.first_ts >= start:
+            return
+        timestamps, socs, labels = history.segments(self.first_ts, now)
+        if self.carry_forward:
+            expired = max(bisect_right(timestamps, start) - 1, 0)
+        else:
+            expired = bisect_left(timestamps, start)
+        for i in range(expired):
+            if i + 1 < len(socs):
+                self._apply(socs[i + 1] - socs[i], labels[i + 1], -1)
+        self.samples -= expired
+        if expired < len(timestamps):
+            self.first_ts = timestamps[expired]
+        else:
+            self.first_ts = self.last_ts = None
+            self.samples = 0
+            self.increase = self.decrease = 0.0
+            self.increases = self.decreases = 0
+
+    def as_dict(self):
+        return {
+            "samples": self.samples,
+            "increase": self.increase,
+            "increases": self.increases,
+            "decrease": self.decrease,
+            "decreases": self.decreases,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+        }
+
+    def restore(self, data, history):
+        """Restore a checkpoint, returns False if the history can't continue it."""
+        first_ts, last_ts = data.get("first_ts"), data.get("last_ts")
+        if first_ts is None or last_ts is None or not history.covers(first_ts):
+            return False
+        timestamps, _ = history.window(last_ts, last_ts)
+        if not len(timestamps):
+            return False
+        self.samples = data["samples"]
+        self.increase = data["increase"]
+        self.increases = data["increases"]
+        self.decrease = data["decrease"]
+        self.decreases = data["decreases"]
+        self.first_ts, self.last_ts = first_ts, last_ts
+        return True
+
+
+class SocAggregators:
+    """Rolling-window aggregators for every configured sensor period.
+
+    State is checkpointed to .storage so a restart only folds in the samples
+    stored since the checkpoint instead of rescanning every window.
+    """
+
+    def __init__(self, hass: HomeAssistant, history, carry_forward=False):
+        self._hass = hass
+        self._history = history
+        self._carry_forward = carry_forward
+        self._aggregators = {}
+        self._checkpoint = {}
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+
+    async def async_load(self):
+        self._checkpoint = await self._store.async_load() or {}
+
+    def register(self, period: timedelta):
+        """Return the aggregator for period, creating it on first use."""
+        aggregator = self._aggregators.get(period)
+        if aggregator is None:
+            aggregator = RollingWindowAggregator(period, self._carry_forward)
+            data = self._checkpoint.get(str(int(period.total_seconds())))
+            if data and aggregator.restore(data, self._history):
+                _LOGGER.debug(f"Restored SoC aggregator for {period}")
+            self._aggregators[period] = aggregator
+        return aggregator
+
+    def _seed_totals(self, periods, now):
+        """Return (results, timestamps) of one vectorised pass over the longest window.
+
+        Run in the executor, it loads numpy and reads the whole window.
+        """
+        import numpy as np
+
+        timestamps, socs, labels = self._history.segments(
+            now - max(periods).total_seconds(), now, self._carry_forward
+        )
+        results = summarise_windows(
+            timestamps,
+            socs,
+            now,
+            periods,
+            self._carry_forward,
+            np.asarray(labels) == CHARGING,
+        )
+        return results, timestamps
+
+    def _seeded(self, aggregators):
+        return [a for a in aggregators if not a.needs_seed(self._history)]
+
+    def advance(self, now=None):
+        """Bring every seeded aggregator up to now, called after each stored sample.
+
+        Unseeded ones wait for the next async_totals to seed them off the loop.
+        """
+        now = time.time() if now is None else now
+        for aggregator in self._seeded(self._aggregators.values()):
+            aggregator.advance(self._history, now)
+        self._store.async_delay_save(self._checkpoint_data, CHECKPOINT_DELAY)
+
+    def reset(self):
+        """Reseed every window on its next use, after older samples were stored."""
+        for aggregator in self._aggregators.values():
+            aggregator.last_ts = None
+
+    async def async_totals(self, periods):
+        """Return {period: summarise_windows style totals}, brought up to now."""
+        aggregators = [self.register(period) for period in periods]
+        unseeded = [a for a in aggregators if a.needs_seed(self._history)]
+        if unseeded:
+            results, timestamps = await self._hass.async_add_executor_job(
+                self._seed_totals, [a.period for a in unseeded], time.time()
+            )
+            for aggregator in unseeded:
+                aggregator.seed(results[aggregator.period], timestamps)
+        now = time.time()
+        for aggregator in self._seeded(aggregators):
+            aggregator.advance(self._history, now)
+        return {aggregator.period: aggregator.totals() for aggregator in aggregators}
+
+    def _checkpoint_data(self):
+        return {
+            str(int(period.total_seconds())): aggregator.as_dict()
+            for period, aggregator in self._aggregators.items()
+        }
+
+
+def get_soc_aggregators(hass: HomeAssistant):
+    """Return the shared aggregators, or None before they are set up."""
+    return hass.data.get(DOMAIN, {}).get("soc_aggregators")
@@ -0,0 +1,243 @@
+"""Compact binary archive of the SoC history."""
+# soc_archive.py
+import calendar
+import logging
+import os
+import re
+import struct
+import time
+from datetime import datetime
+from functools import lru_cache
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# uint32 seconds since the start of the file's UTC month, uint16 SoC x 100
+RECORD_STRUCT = struct.Struct("<IH")
+
+# Months of archive files kept
+ARCHIVE_RETENTION_MONTHS = 13
+
+_FILENAME = re.compile(r"^soc_(\d{4})-(\d{2})\.bin$")
+
+
+@lru_cache(maxsize=None)
+def record_dtype():
+    """Return the numpy dtype matching RECORD_STRUCT, numpy loads on first use."""
+    import numpy as np
+
+    return np.dtype([("offset", "<u4"), ("soc", "<u2")])
+
+
+def encode_soc(soc):
+    return min(max(int(round(soc * 100)), 0), 0xFFFF)
+
+
+def month_start(ts):
+    """Return the epoch seconds of the start of the UTC month holding ts."""
+    moment = time.gmtime(ts)
+    return calendar.timegm((moment.tm_year, moment.tm_mon, 1, 0, 0, 0))
+
+
+class SocArchive:
+    """Append-only monthly files of fixed-width six byte SoC records.
+
+    A year of one-minute samples is about 3 MB. Readers np.memmap the month
+    files directly, so loading a long window for predictions or backtests
+    costs a page-in rather than a query. Appends only happen on the SoC
+    writer thread.
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._file = None
+        self._file_month = None
+        self._last_ts = None
+
+    def _path(self, month):
+        moment = time.gmtime(month)
+        return os.path.join(
+            self._directory, f"soc_{moment.tm_year:04d}-{moment.tm_mon:02d}.bin"
+        )
+
+    def months(self):
+        """Return the month starts that have an archive file, oldest first."""
+        if not os.path.isdir(self._directory):
+            return []
+        months = []
+        for name in os.listdir(self._directory):
+            match = _FILENAME.match(name)
+            if match:
+                months.append(
+                    calendar.timegm((int(match[1]), int(match[2]), 1, 0, 0, 0))
+                )
+        return sorted(months)
+
+    def month_records(self, month):
+        """Return a read-only memmap of one month's records, zero-copy."""
+        import numpy as np
+
+        path = self._path(month)
+        try:
+            count = os.path.getsize(path) // RECORD_STRUCT.size
+        except OSError:
+            count = 0
+        if not count:
+            return np.zeros(0, dtype=record_dtype())
+        # Ignore a torn record at the end of the file
+        return np.memmap(path, dtype=record_dtype(), mode="r", shape=(count,))
+
+    def append(self, ts, soc):
+        """Append a sample, samples not newer than the last one are skipped."""
+        ts = int(ts)
+        if self._last_ts is None:
+            self._last_ts = self._read_last_ts()
+        if self._last_ts is not None and ts <= self._last_ts:
+            return
+        month = month_start(ts)
+        if month != self._file_month:
+            self.close()
+            os.makedirs(self._directory, exist_ok=True)
+            path = self._path(month)
+            # Drop a torn record left by a crash so appends stay aligned
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            if size % RECORD_STRUCT.size:
+                os.truncate(path, size - size % RECORD_STRUCT.size)
+            self._file = open(path, "ab")
+            self._file_month = month
+        self._file.write(RECORD_STRUCT.pack(ts - month, encode_soc(soc)))
+        self._file.flush()
+        self._last_ts = ts
+
+    def merge(self, rows):
+        """Merge (ts, soc) rows in any order, existing records win on equal ts.
+
+        Each month touched is rewritten and swapped in with os.replace, memmaps
+        already open keep reading the previous file.
+        """
+        import numpy as np
+
+        by_month = {}
+        for ts, soc in rows:
+            ts = int(ts)
+            by_month.setdefault(month_start(ts), []).append((ts, soc))
+        os.makedirs(self._directory, exist_ok=True)
+        for month, month_rows in by_month.items():
+            added = np.array(
+                [(ts - month, encode_soc(soc)) for ts, soc in month_rows],
+                dtype=record_dtype(),
+            )
+            records = np.concatenate((np.array(self.month_records(month)), added))
+            # unique keeps the first of equal offsets, the existing record
+            _, index = np.unique(records["offset"], return_index=True)
+            if month == self._file_month:
+                self.close()
+            path = self._path(month)
+            records[index].tofile(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        self._last_ts = None
+
+    def _read_last_ts(self):
+        for month in reversed(self.months()):
+            records = self.month_records(month)
+            if len(records):
+                return month + int(records["offset"][-1])
+        return None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_month = None
+
+    def read_arrays(self, start_ts, end_ts, carry_forward=False):
+        """Return float (timestamps, socs) arrays for start <= ts <= end.
+
+        With carry_forward the arrays start at the sample in force at start_ts,
+        which may sit in an earlier month file.
+        """
+        import numpy as np
+
+        parts = []
+        months = self.months()
+        for month in months:
+            if month > end_ts or month_start(start_ts) > month:
+                continue
+            records = self.month_records(month)
+            offsets = records["offset"]
+            lo = np.searchsorted(offsets, start_ts - month, "left")
+            hi = np.searchsorted(offsets, end_ts - month, "right")
+            if hi > lo:
+                parts.append((month, records[lo:hi]))
+
+        if carry_forward:
+            previous = self._sample_in_force(months, start_ts)
+            if previous is not None and (
+                not parts or previous[0] + int(previous[1]["offset"][0]) < start_ts
+            ):
+                parts.insert(0, previous)
+
+        if not parts:
+            return np.zeros(0), np.zeros(0)
+        timestamps = np.concatenate(
+            [month + records["offset"].astype(float) for month, records in parts]
+        )
+        socs = np.concatenate(
+            [records["soc"].astype(float) / 100 for _, records in parts]
+        )
+        return timestamps, socs
+
+    def _sample_in_force(self, months, ts):
+        import numpy as np
+
+        for month in reversed(months):
+            if month > ts:
+                continue
+            records = self.month_records(month)
+            index = np.searchsorted(records["offset"], ts - month, "right") - 1
+            if index >= 0:
+                return month, records[index : index + 1]
+        return None
+
+    def get_soc_data(self, start_time: datetime, end_time: datetime, carry_forward=False):
+        """Return (epoch seconds, soc) rows like battery_soc_calcs.get_soc_data."""
+        timestamps, socs = self.read_arrays(
+            int(start_time.timestamp()), int(end_time.timestamp()), carry_forward
+        )
+        return list(zip(timestamps.astype(int).tolist(), socs.tolist()))
+
+    def import_database(self, conn):
+        """Seed an empty archive from the raw SQLite samples, a writer job."""
+        if self.months():
+            return False
+        rows = conn.execute("SELECT ts, soc FROM soc_data ORDER BY ts").fetchall()
+        for ts, soc in rows:
+            self.append(ts, soc)
+        _LOGGER.info(f"Seeded the SoC archive with {len(rows)} samples")
+        return False
+
+    def prune(self, now=None):
+        """Delete month files older than ARCHIVE_RETENTION_MONTHS."""
+        moment = time.gmtime(time.time() if now is None else now)
+        months_since_epoch = moment.tm_year * 12 + moment.tm_mon - 1
+        keep = months_since_epoch - ARCHIVE_RETENTION_MONTHS + 1
+        cutoff = calendar.timegm((keep // 12, keep % 12 + 1, 1, 0, 0, 0))
+        for month in self.months():
+            if month < cutoff and month != self._file_month:
+                os.remove(self._path(month))
+                _LOGGER.info(f"Removed SoC archive {self._path(month)}")
+
+
+def get_archive_directory(hass: HomeAssistant):
+    return hass.config.path(
+        "custom_components", "battery_automation", "database", "archive"
+    )
+
+
+def get_soc_archive(hass: HomeAssistant):
+    """Return the SoC archive when it is the history backend, else None."""
+    return hass.data.get(DOMAIN, {}).get("soc_archive")
@@ -0,0 +1,194 @@
+"""One-shot backfill of the SoC history from the Home Assistant recorder."""
+# soc_backfill.py
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from functools import partial
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder import history as recorder_history
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+from .const import DOMAIN
+from .soc_aggregators import get_soc_aggregators
+from .soc_archive import get_soc_archive
+from .soc_database import read_connection
+from .soc_history import async_reload_soc_history, get_soc_history
+from .soc_profile import get_soc_profile
+from .soc_regression import get_soc_regressions
+from .soc_retention import get_meta, merge_rollup_rows, set_meta
+
+_LOGGER = logging.getLogger(__name__)
+
+# How far back the recorder is asked for history, it returns what it kept
+BACKFILL_SPAN = timedelta(days=30)
+
+# Recorder history fetched, inserted and committed per step
+BACKFILL_CHUNK = timedelta(days=1)
+
+# Live samples always win over recorder states
+BACKFILL_INSERT_SQL = "INSERT OR IGNORE INTO soc_data (ts, soc) VALUES (?, ?)"
+
+
+class SocBackfill:
+    """Progress of the recorder backfill, shown by the backfill sensor."""
+
+    def __init__(self):
+        self.status = "pending"
+        self.progress = 0.0
+        self.samples = 0
+
+
+def start_backfill(conn):
+    """Fix the backfill range on the first run, a writer job.
+
+    Only the gap before the first stored sample is filled, so the range is
+    kept in soc_meta before any recorder rows move that first sample.
+    """
+    if get_meta(conn, "backfill_until") is None:
+        first = conn.execute("SELECT MIN(ts) FROM soc_data").fetchone()[0]
+        first_5m = conn.execute("SELECT MIN(bucket) FROM soc_rollup_5m").fetchone()[0]
+        if first_5m is not None and (first is None or first_5m < first - 5 * 60):
+            # Older raw samples were pruned, stop at the first daily rollup
+            first = conn.execute("SELECT MIN(bucket) FROM soc_rollup_1d").fetchone()[0]
+        until = int(first if first is not None else time.time())
+        set_meta(conn, "backfill_until", until)
+        set_meta(conn, "backfill_ts", until - int(BACKFILL_SPAN.total_seconds()))
+    return False
+
+
+def store_backfill_chunk(conn, rows, chunk_end, archive=None):
+    """Insert one chunk of recorder rows and advance the watermark, a writer job.
+
+    The rows and the watermark are committed in the same transaction, so an
+    interrupted backfill resumes at the first chunk that wasn't stored. Rows
+    the rollup has already passed are rolled up here, skipping rows whose
+    timestamp was already stored.
+    """
+    stored = set()
+    if rows:
+        stored = {
+            row[0]
+            for row in conn.execute(
+                "SELECT ts FROM soc_data WHERE ts BETWEEN ? AND ?",
+                (rows[0][0], rows[-1][0]),
+            )
+        }
+    conn.executemany(BACKFILL_INSERT_SQL, rows)
+    inserted = [row for row in rows if row[0] not in stored]
+    watermark = get_meta(conn, "rollup_ts", -1)
+    rolled = [row for row in inserted if row[0] <= watermark]
+    if rolled:
+        merge_rollup_rows(conn, rolled, watermark)
+    set_meta(conn, "backfill_ts", chunk_end)
+    if archive is not None and rows:
+        archive.merge(rows)
+    return False
+
+
+def read_backfill_range(hass: HomeAssistant):
+    """Return (start, resume_from, until) epoch seconds, run in the executor."""
+    with read_connection(hass) as conn:
+        until = int(get_meta(conn, "backfill_until"))
+        resume_from = int(get_meta(conn, "backfill_ts"))
+    return until - int(BACKFILL_SPAN.total_seconds()), resume_from, until
+
+
+def fetch_recorder_rows(hass: HomeAssistant, entity_id, start_ts, end_ts):
+    """Return sorted (ts, soc) rows recorded for entity_id, run in the recorder."""
+    states = recorder_history.state_changes_during_period(
+        hass,
+        dt_util.utc_from_timestamp(start_ts),
+        dt_util.utc_from_timestamp(end_ts),
+        entity_id,
+        no_attributes=True,
+        include_start_time_state=False,
+    ).get(entity_id, [])
+    rows = {}
+    for state in states:
+        try:
+            rows[int(state.last_updated.timestamp())] = float(state.state)
+        except ValueError:
+            continue
+    return sorted((ts, soc) for ts, soc in rows.items() if start_ts <= ts < end_ts)
+
+
+def _notify(hass: HomeAssistant):
+    sensor = hass.data[DOMAIN].get("backfill_progress_sensor")
+    if sensor is not None and sensor.hass is not None:
+        sensor.async_schedule_update_ha_state(True)
+
+
+async def async_run_backfill(hass: HomeAssistant, entity_id):
+    """Stream recorder history for entity_id into the SoC database in chunks."""
+    backfill = hass.data[DOMAIN].setdefault("soc_backfill", SocBackfill())
+    writer = hass.data[DOMAIN].get("soc_writer")
+    if writer is None or "recorder" not in hass.config.components:
+        backfill.status = "unavailable"
+        _notify(hass)
+        return
+
+    try:
+        await asyncio.wrap_future(writer.submit(start_backfill))
+        start, chunk_start, until = await hass.async_add_executor_job(
+            read_backfill_range, hass
+        )
+    except Exception as e:
+        backfill.status = "failed"
+        _notify(hass)
+        _LOGGER.error(f"Error starting the SoC backfill: {e}")
+        return
+    if chunk_start >= until:
+        backfill.status = "done"
+        backfill.progress = 100.0
+        _notify(hass)
+        return
+
+    backfill.status = "running"
+    archive = get_soc_archive(hass)
+    chunk = int(BACKFILL_CHUNK.total_seconds())
+    stored = None
+    try:
+        while chunk_start < until:
+            chunk_end = min(chunk_start + chunk, until)
+            rows = await get_instance(hass).async_add_executor_job(
+                fetch_recorder_rows, hass, entity_id, chunk_start, chunk_end
+            )
+            # The next chunk is fetched while this one is stored, but only
+            # queued once it committed so a failed chunk stops the backfill
+            # before the watermark moves past it
+            if stored is not None:
+                await asyncio.wrap_future(stored)
+            stored = writer.submit(
+                partial(
+                    store_backfill_chunk, rows=rows, chunk_end=chunk_end, archive=archive
+                )
+            )
+            backfill.samples += len(rows)
+            backfill.progress = round(100 * (chunk_end - start) / (until - start), 1)
+            _notify(hass)
+            chunk_start = chunk_end
+        if stored is not None:
+            await asyncio.wrap_future(stored)
+    except Exception as e:
+        backfill.status = "failed"
+        _notify(hass)
+        _LOGGER.error(f"Error backfilling SoC history from the recorder: {e}")
+        return
+
+    # Calculations pick up the older samples from here on
+    history = get_soc_history(hass)
+    if history is not None:
+        await async_reload_soc_history(hass, history)
+    aggregators = get_soc_aggregators(hass)
+    if aggregators is not None:
+        aggregators.reset()
+    profile = get_soc_profile(hass)
+    if profile is not None:
+        await profile.async_seed()
+    regressions = get_soc_regressions(hass)
+    if regressions is not None:
+        regressions.reset()
+    backfill.status = "done"
+    _notify(hass)
+    _LOGGER.info(f"Backfilled {backfill.samples} SoC samples from the recorder")
@@ -0,0 +1,386 @@
+"""SQLite storage for the battery SoC history."""
+# soc_database.py
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+DATABASE_FILENAME = "soc_data.db"
+
+# Version 1 was the original text timestamp table, version 2 keys samples by
+# integer epoch seconds so readers never parse strings, version 3 adds the
+# downsampled rollup tables and the retention bookkeeping
+SCHEMA_VERSION = 3
+
+INSERT_SOC_SQL = "INSERT OR REPLACE INTO soc_data (ts, soc) VALUES (?, ?)"
+
+CREATE_SOC_TABLE_SQL = """CREATE TABLE IF NOT EXISTS soc_data
+                      (ts INTEGER PRIMARY KEY, soc REAL) WITHOUT ROWID"""
+
+# Rollup tables as (table, bucket seconds, days kept or None for forever)
+ROLLUP_TIERS = (
+    ("soc_rollup_5m", 5 * 60, 90),
+    ("soc_rollup_1h", 60 * 60, 730),
+    ("soc_rollup_1d", 24 * 60 * 60, None),
+)
+
+CREATE_ROLLUP_TABLE_SQL = """CREATE TABLE IF NOT EXISTS {table}
+                      (bucket INTEGER PRIMARY KEY, soc_min REAL, soc_max REAL,
+                      soc_first REAL, soc_last REAL, increase REAL, decrease REAL,
+                      increases INTEGER, decreases INTEGER, samples INTEGER)
+                      WITHOUT ROWID"""
+
+CREATE_META_TABLE_SQL = """CREATE TABLE IF NOT EXISTS soc_meta
+                      (key TEXT PRIMARY KEY, value REAL) WITHOUT ROWID"""
+
+# Page cache per read connection in KiB (negative pragma value) and the
+# size of the database mapped into memory for reads
+READ_CACHE_KIB = 8 * 1024
+READ_MMAP_BYTES = 64 * 1024 * 1024
+
+# Sentinels telling the writer thread to commit and exit, or to commit now
+_STOP = object()
+_FLUSH = object()
+
+
+def get_database_path(hass: HomeAssistant):
+    """Return the path of the SoC database file."""
+    return hass.config.path(
+        "custom_components", "battery_automation", "database", DATABASE_FILENAME
+    )
+
+
+def init_database(hass: HomeAssistant):
+    """Create the database directory and schema if they don't exist."""
+    db_path = get_database_path(hass)
+    db_directory = os.path.dirname(db_path)
+    if not os.path.exists(db_directory):
+        os.makedirs(db_directory)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        # WAL is persistent in the file, readers no longer block the writer
+        conn.execute("PRAGMA journal_mode=WAL")
+        migrate_database(conn)
+    finally:
+        conn.close()
+
+
+def to_epoch(timestamp: datetime):
+    """Convert a local datetime to the integer epoch seconds used as the key."""
+    return int(timestamp.timestamp())
+
+
+def migrate_database(conn):
+    """Bring the schema up to SCHEMA_VERSION, converting old rows in place."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(soc_data)")]
+    with conn:
+        # Explicit transaction so the DDL is rolled back with the copy on error
+        conn.execute("BEGIN")
+        if version < 2 and "timestamp" in columns:
+            _LOGGER.info("Migrating soc_data to integer epoch timestamps")
+            conn.execute("ALTER TABLE soc_data RENAME TO soc_data_v1")
+            conn.execute(CREATE_SOC_TABLE_SQL)
+            rows = conn.execute("SELECT timestamp, soc FROM soc_data_v1").fetchall()
+            conn.executemany(
+                INSERT_SOC_SQL,
+                (
+                    (to_epoch(datetime.fromisoformat(timestamp)), soc)
+                    for timestamp, soc in rows
+                    if timestamp is not None
+                ),
+            )
+            conn.execute("DROP TABLE soc_data_v1")
+        else:
+            conn.execute(CREATE_SOC_TABLE_SQL)
+        if version < 3:
+            for table, _, _ in ROLLUP_TIERS:
+                conn.execute(CREATE_ROLLUP_TABLE_SQL.format(table=table))
+            conn.execute(CREATE_META_TABLE_SQL)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+# Wait before writing samples again after a failed commit
+WRITE_RETRY_SECONDS = 10
+
+# flush() checks the writer thread is still alive this often while waiting
+FLUSH_CHECK_SECONDS = 1
+
+
+class SocDataWriter:
+    """Long-lived writer owning the only write connection to the SoC database.
+
+    Writes are queued from the event loop and executed on a dedicated thread,
+    so storing a sample never touches the disk from the loop. Samples are
+    buffered and committed in one executemany transaction once flush_samples
+    are pending or the oldest has waited flush_interval seconds, the default
+    of one sample commits each straight away. Buffered samples stay readable
+    through pending(). With an archive every committed sample is also
+    appended to it on the same thread. Samples a failed commit leaves
+    pending are retried after WRITE_RETRY_SECONDS.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        archive=None,
+        flush_interval=0,
+        flush_samples=1,
+        synchronous="NORMAL",
+    ):
+        self._db_path = db_path
+        self._archive = archive
+        self._flush_interval = flush_interval
+        self._flush_samples = max(flush_samples, 1)
+        self._synchronous = synchronous
+        self._pending = []
+        self._pending_since = None
+        self._retry_at = None
+        self._lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._run, name="battery_automation_soc_writer", daemon=True
+        )
+
+    def start(self):
+        """Start the writer thread."""
+        self._thread.start()
+
+    def insert(self, timestamp, soc):
+        """Buffer a SoC sample for insertion, safe to call from the event loop."""
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append((timestamp, soc))
+            count = len(self._pending)
+        if count >= self._flush_samples:
+            self._queue.put(_FLUSH)
+        elif count == 1:
+            # Wake the writer so it waits on this sample's flush deadline
+            self._queue.put(None)
+
+    def pending(self):
+        """Return the (ts, soc) samples not yet committed, oldest first."""
+        with self._lock:
+            return list(self._pending)
+
+    def submit(self, job):
+        """Queue a job to run on the writer thread with its connection.
+
+        Buffered samples are committed first. The job is called as job(conn)
+        and committed afterwards. If it returns True it is queued again, so
+        long work runs in small batches with inserts interleaved between them.
+        Returns a Future holding the job's last result once committed, or its
+        exception if it failed.
+        """
+        future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+
+        def mark_done(conn):
+            done.set()
+
+        self.submit(mark_done)
+        # Don't wait forever on a writer thread that has died
+        while not done.wait(FLUSH_CHECK_SECONDS):
+            if not self._thread.is_alive():
+                return
+
+    def close(self):
+        """Flush pending writes and close the connection, blocks until done."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL, the default, is durable in WAL mode and skips the fsync on
+        # every commit, OFF also skips it at checkpoints
+        conn.execute(f"PRAGMA synchronous={self._synchronous}")
+        return conn
+
+    def _flush_timeout(self):
+        with self._lock:
+            if not self._pending:
+                return None
+            now = time.monotonic()
+            timeout = self._flush_interval - (now - self._pending_since)
+        if self._retry_at is not None:
+            timeout = max(timeout, self._retry_at - now)
+        return max(timeout, 0)
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self._flush_timeout())
+                except queue.Empty:
+                    item = _FLUSH
+                if item is _STOP:
+                    break
+                if item is _FLUSH:
+                    self._write_pending(conn)
+                elif item is not None:
+                    self._write_pending(conn)
+                    self._run_job(conn, *item)
+        finally:
+            self._write_pending(conn, retry_now=True)
+            self._cancel_jobs()
+            conn.close()
+            if self._archive is not None:
+                self._archive.close()
+            _LOGGER.info("SoC writer closed")
+
+    def _write_pending(self, conn, retry_now=False):
+        rows = self.pending()
+        if not rows:
+            return
+        if (
+            not retry_now
+            and self._retry_at is not None
+            and time.monotonic() < self._retry_at
+        ):
+            return
+        try:
+            # Reusing the same SQL string hits sqlite3's statement cache,
+            # so the insert is only prepared once per connection
+            conn.executemany(INSERT_SOC_SQL, rows)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            _LOGGER.error(f"Error writing {len(rows)} SoC samples, will retry: {e}")
+            # Keep the rows, they are retried with the next batch
+            self._retry_at = time.monotonic() + WRITE_RETRY_SECONDS
+            return
+        self._retry_at = None
+        if self._archive is not None:
+            for timestamp, soc in rows:
+                self._append_archive(timestamp, soc)
+        # Drop the rows only once committed so readers always see them
+        with self._lock:
+            del self._pending[: len(rows)]
+            if self._pending:
+                self._pending_since = time.monotonic()
+
+    def _append_archive(self, timestamp, soc):
+        try:
+            self._archive.append(timestamp, soc)
+        except OSError as e:
+            _LOGGER.error(f"Error appending SoC data to the archive: {e}")
+
+    def _run_job(self, conn, job, future):
+        try:
+            more = job(conn)
+            conn.commit()
+        except Exception as e:
+            # A failing job must not take the writer thread down with it
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            _LOGGER.exception("Error running SoC database job")
+            future.set_exception(e)
+            return
+        if more:
+            self._queue.put((job, future))
+        else:
+            future.set_result(more)
+
+    def _cancel_jobs(self):
+        # Jobs still queued at close never run
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, tuple):
+                item[1].cancel()
+
+
+class SocReadPool:
+    """Read-only connections to the SoC database, one per executor thread.
+
+    Connections are opened with mode=ro and query_only and kept open with a
+    warm page cache, so reads skip connection setup and, with WAL, never
+    take a lock the writer waits on.
+    """
+
+    def __init__(self, db_path):
+        self._uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            conn.execute(f"PRAGMA cache_size=-{READ_CACHE_KIB}")
+            conn.execute(f"PRAGMA mmap_size={READ_MMAP_BYTES}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Close every pooled connection, once no more reads are running."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+@contextmanager
+def read_connection(hass: HomeAssistant):
+    """Yield a read connection, pooled once the integration is set up."""
+    pool = hass.data.get(DOMAIN, {}).get("soc_read_pool")
+    if pool is not None:
+        yield pool.connection()
+        return
+    conn = sqlite3.connect(get_database_path(hass))
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def get_pending_samples(hass: HomeAssistant, start_ts, end_ts, after_ts=None):
+    """Return samples still buffered in the writer for start <= ts <= end.
+
+    Only samples newer than after_ts are returned, the newest row a caller
+    already read from storage.
+    """
+    writer = hass.data.get(DOMAIN, {}).get("soc_writer")
+    if writer is None:
+        return []
+    return [
+        (ts, soc)
+        for ts, soc in writer.pending()
+        if start_ts <= ts <= end_ts and (after_ts is None or ts > after_ts)
+    ]
@@ -0,0 +1,203 @@
+"""In-memory SoC history shared by every calculation."""
+# soc_history.py
+import logging
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN, STORAGE_MODE_CHANGE
+from .soc_archive import get_soc_archive
+from .soc_database import read_connection
+from .soc_retention import get_meta
+from .soc_segments import SocSegmenter
+
+_LOGGER = logging.getLogger(__name__)
+
+# Days of samples kept in memory, a day beyond the longest usage sensor so a
+# checkpointed seven day window can still be resumed after a restart
+SOC_HISTORY_SPAN = timedelta(days=8)
+
+# Initial slots, eight days of one-minute samples
+DEFAULT_CAPACITY = 8 * 24 * 60
+
+
+def _zeros(capacity):
+    return array("d", bytes(8 * capacity))
+
+
+def _labels(capacity):
+    return array("b", bytes(capacity))
+
+
+class SocHistory:
+    """The last few days of SoC samples in parallel array('d') buffers.
+
+    Timestamps (epoch seconds) and SoC values live in preallocated arrays that
+    are only ever written past the published size, so readers on executor
+    threads can take zero-copy memoryview slices without locking. When the
+    buffer is full the live tail is moved to fresh arrays, old slices keep
+    the previous arrays alive until they are released. Each sample is also
+    labelled charging, discharging or idle as it arrives.
+    """
+
+    def __init__(self, span=SOC_HISTORY_SPAN, capacity=DEFAULT_CAPACITY):
+        self.span = span
+        # Epoch seconds from which the buffer holds every stored sample
+        self.loaded_from = None
+        # Bumped whenever the samples change, cached results key on it
+        self.version = 0
+        self._state = (_zeros(capacity), _zeros(capacity), _labels(capacity), 0)
+        self._segmenter = SocSegmenter()
+        # Segmenter state before the last sample, for when its SoC is replaced
+        self._segmenter_before_last = self._segmenter
+
+    def __len__(self):
+        return self._state[3]
+
+    def load(self, rows, loaded_from):
+        """Replace the contents with (ts, soc) rows sorted by time."""
+        capacity = max(DEFAULT_CAPACITY, 2 * len(rows))
+        timestamps, socs = _zeros(capacity), _zeros(capacity)
+        labels = _labels(capacity)
+        segmenter = SocSegmenter()
+        for i, (ts, soc) in enumerate(rows):
+            timestamps[i] = ts
+            socs[i] = soc
+            if i == len(rows) - 1:
+                self._segmenter_before_last = segmenter.copy()
+            labels[i] = segmenter.add(soc)
+        if not rows:
+            self._segmenter_before_last = segmenter
+        self._segmenter = segmenter
+        self._state = (timestamps, socs, labels, len(rows))
+        self.loaded_from = loaded_from
+        self.version += 1
+
+    def append(self, ts, soc):
+        """Add a sample from the event loop, older samples are ignored."""
+        timestamps, socs, labels, size = self._state
+        if size and ts <= timestamps[size - 1]:
+            if ts == timestamps[size - 1] and socs[size - 1] != soc:
+                socs[size - 1] = soc
+                self._segmenter = self._segmenter_before_last.copy()
+                labels[size - 1] = self._segmenter.add(soc)
+                self.version += 1
+            return
+        if size == len(timestamps):
+            timestamps, socs, labels, size = self._compact(ts)
+        timestamps[size] = ts
+        socs[size] = soc
+        self._segmenter_before_last = self._segmenter.copy()
+        labels[size] = self._segmenter.add(soc)
+        self._state = (timestamps, socs, labels, size + 1)
+        self.version += 1
+
+    def _compact(self, now):
+        timestamps, socs, labels, size = self._state
+        cutoff = now - self.span.total_seconds()
+        # Keep the sample in force at the cutoff for step-function reads
+        keep_from = max(bisect_right(timestamps, cutoff, 0, size) - 1, 0)
+        live = size - keep_from
+        capacity = len(timestamps)
+        if live >= capacity // 2:
+            capacity *= 2
+        new_timestamps, new_socs = _zeros(capacity), _zeros(capacity)
+        new_labels = _labels(capacity)
+        new_timestamps[:live] = timestamps[keep_from:size]
+        new_socs[:live] = socs[keep_from:size]
+        new_labels[:live] = labels[keep_from:size]
+        if keep_from:
+            self.loaded_from = max(self.loaded_from or cutoff, cutoff)
+        return new_timestamps, new_socs, new_labels, live
+
+    def covers(self, start_ts):
+        """Return True if every stored sample from start_ts on is in memory."""
+        return self.loaded_from is not None and start_ts >= self.loaded_from
+
+    def window(self, start_ts, end_ts, carry_forward=False):
+        """Return zero-copy (timestamps, socs) memoryviews for start <= ts <= end.
+
+        With carry_forward the slice starts at the sample in force at start_ts,
+        the step-function view of change-only storage.
+        """
+        return self.segments(start_ts, end_ts, carry_forward)[:2]
+
+    def segments(self, start_ts, end_ts, carry_forward=False):
+        """Return window() with a third memoryview of the samples' labels."""
+        timestamps, socs, labels, size = self._state
+        if carry_forward:
+            lo = max(bisect_right(timestamps, start_ts, 0, size) - 1, 0)
+        else:
+            lo = bisect_left(timestamps, start_ts, 0, size)
+        hi = bisect_right(timestamps, end_ts, lo, size)
+        return (
+            memoryview(timestamps)[lo:hi],
+            memoryview(socs)[lo:hi],
+            memoryview(labels)[lo:hi],
+        )
+
+
+def read_soc_history(hass: HomeAssistant, span: timedelta):
+    """Return (rows, loaded_from) for the last span of samples, run in the executor."""
+    now = time.time()
+    loaded_from = int(now - span.total_seconds())
+    archive = get_soc_archive(hass)
+    if archive is not None:
+        timestamps, socs = archive.read_arrays(loaded_from, now, carry_forward=True)
+        return list(zip(timestamps.tolist(), socs.tolist())), loaded_from
+
+    with read_connection(hass) as conn:
+        # Raw samples older than the retention window have been pruned
+        loaded_from = max(loaded_from, int(get_meta(conn, "pruned_before", 0)))
+        # Include the sample in force at loaded_from for step-function reads
+        rows = conn.execute(
+            """SELECT ts, soc FROM soc_data WHERE ts >= COALESCE(
+                (SELECT MAX(ts) FROM soc_data WHERE ts <= ?), ?) ORDER BY ts""",
+            (loaded_from, loaded_from),
+        ).fetchall()
+    return rows, loaded_from
+
+
+def load_soc_history(hass: HomeAssistant, history: SocHistory):
+    """Preload the history buffer from storage, run in the executor."""
+    rows, loaded_from = read_soc_history(hass, history.span)
+    history.load(rows, loaded_from)
+    _LOGGER.info(f"Loaded {len(rows)} SoC samples into memory")
+
+
+async def async_reload_soc_history(hass: HomeAssistant, history: SocHistory):
+    """Reload the history after older samples were stored, e.g. by a backfill.
+
+    Queued writes are flushed first and samples appended while the rows were
+    read are carried over, so no live sample is lost.
+    """
+    writer = hass.data[DOMAIN].get("soc_writer")
+    if writer is not None:
+        await hass.async_add_executor_job(writer.flush)
+    rows, loaded_from = await hass.async_add_executor_job(
+        read_soc_history, hass, history.span
+    )
+    last_ts = rows[-1][0] if rows else loaded_from
+    timestamps, socs = history.window(last_ts, float("inf"))
+    rows = list(rows) + [
+        (ts, soc) for ts, soc in zip(timestamps, socs) if ts > last_ts
+    ]
+    history.load(rows, loaded_from)
+    _LOGGER.info(f"Reloaded {len(rows)} SoC samples into memory")
+
+
+def is_step_storage(hass: HomeAssistant):
+    """Return True if samples are stored on change only and read as steps."""
+    return hass.data.get(DOMAIN, {}).get("soc_storage_mode") == STORAGE_MODE_CHANGE
+
+
+def get_soc_history(hass: HomeAssistant):
+    """Return the shared SoC history, or None before it is loaded."""
+    return hass.data.get(DOMAIN, {}).get("soc_history")
+
+
+def get_data_version(hass: HomeAssistant):
+    """Return the SoC history version, or None before it is loaded."""
+    history = get_soc_history(hass)
+    return None if history is None else history.version
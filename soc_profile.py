@@ -0,0 +1,72 @@
+"""Hour-of-week SoC rate profile used as a fast predictor."""
+# soc_profile.py
+from datetime import datetime, timedelta
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+from .battery_soc_calcs import get_rollup_samples, get_soc_data
+from .soc_archive import get_soc_archive
+from .soc_database import to_epoch
+from .soc_rate_profile import ProfileSocModel, SocProfile
+
+STORAGE_KEY = f"{DOMAIN}.profile"
+STORAGE_VERSION = 1
+
+# History used to seed a profile without a checkpoint
+PROFILE_SEED_SPAN = timedelta(days=28)
+
+# Checkpoints are coalesced into one write per this many seconds
+CHECKPOINT_DELAY = 5 * 60
+
+
+def seed_soc_profile(hass: HomeAssistant, profile: SocProfile):
+    """Fold PROFILE_SEED_SPAN of stored samples into profile, run in the executor.
+
+    Without the archive raw samples only go back the raw retention, the
+    five minute rollup fills in the rest of the span.
+    """
+    end_time = datetime.now()
+    start_time = end_time - PROFILE_SEED_SPAN
+    rows = get_soc_data(hass, start_time, end_time)
+    if get_soc_archive(hass) is None:
+        first = rows[0][0] if rows else to_epoch(end_time)
+        rows = get_rollup_samples(hass, to_epoch(start_time), first) + rows
+    profile.load_rows(rows)
+
+
+class SocProfileStore:
+    """The shared profile and its .storage checkpoint."""
+
+    def __init__(self, hass: HomeAssistant):
+        self.profile = SocProfile()
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+
+    async def async_load(self):
+        """Restore the checkpoint, seeding from stored samples without one."""
+        data = await self._store.async_load()
+        if not data or not self.profile.restore(data):
+            await self.async_seed()
+
+    async def async_seed(self):
+        """Rebuild the profile from stored samples, e.g. after a backfill."""
+        profile = SocProfile()
+        await self._hass.async_add_executor_job(seed_soc_profile, self._hass, profile)
+        self.profile = profile
+        self._store.async_delay_save(self.profile.as_dict, CHECKPOINT_DELAY)
+
+    def add(self, ts, soc):
+        self.profile.add(ts, soc)
+        self._store.async_delay_save(self.profile.as_dict, CHECKPOINT_DELAY)
+
+    def model(self):
+        """Return a ProfileSocModel from the latest sample, or None without one."""
+        if self.profile.last_sample is None:
+            return None
+        ts, soc = self.profile.last_sample
+        return ProfileSocModel(list(self.profile.rates), ts, soc)
+
+
+def get_soc_profile(hass: HomeAssistant):
+    """Return the shared SoC profile store, or None before it is set up."""
+    return hass.data.get(DOMAIN, {}).get("soc_profile")
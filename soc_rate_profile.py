@@ -0,0 +1,114 @@
+"""Hour-of-week SoC rate profile and its predictor.
+
+Only the standard library, so the backtest can replay it outside Home
+Assistant.
+"""
+# soc_rate_profile.py
+import time
+from datetime import datetime
+
+SLOT_SECONDS = 30 * 60
+SLOTS_PER_WEEK = 7 * 24 * 60 * 60 // SLOT_SECONDS
+
+# Seconds of history a slot's average is weighted by at most, older
+# observations fade out so the profile follows changing habits
+SLOT_MEMORY_SECONDS = 4 * SLOT_SECONDS
+
+# Gaps between samples longer than this (HA down) teach the profile nothing
+MAX_SAMPLE_GAP = 2 * 60 * 60
+
+
+def slot_start(ts):
+    """Return (slot index, epoch start of the slot) for ts in local time."""
+    moment = datetime.fromtimestamp(ts)
+    slot = moment.weekday() * 48 + moment.hour * 2 + moment.minute // 30
+    start = moment.replace(minute=moment.minute // 30 * 30, second=0, microsecond=0)
+    return slot, start.timestamp()
+
+
+class SocProfile:
+    """Average SoC discharge rate for each half hour of the week.
+
+    Each stored sample spreads its change from the previous sample over the
+    half-hour slots the gap crossed and folds it into those slots' running
+    averages, O(slots crossed) per sample. Spans where SoC rose are charging
+    and are left out, so the profile integrates forward as expected usage.
+    """
+
+    def __init__(self):
+        # %/second per slot, zero or negative
+        self.rates = [0.0] * SLOTS_PER_WEEK
+        # Seconds of observations behind each slot's rate
+        self.weights = [0.0] * SLOTS_PER_WEEK
+        self.last_sample = None
+
+    def add(self, ts, soc):
+        """Fold in a sample, older samples than the last one are ignored."""
+        last = self.last_sample
+        if last is not None and ts <= last[0]:
+            return
+        self.last_sample = (ts, soc)
+        if last is None or ts - last[0] > MAX_SAMPLE_GAP or soc > last[1]:
+            return
+        rate = (soc - last[1]) / (ts - last[0])
+        start = last[0]
+        while start < ts:
+            slot, slot_begin = slot_start(start)
+            end = min(slot_begin + SLOT_SECONDS, ts)
+            seconds = end - start
+            weight = self.weights[slot]
+            self.rates[slot] = (self.rates[slot] * weight + rate * seconds) / (
+                weight + seconds
+            )
+            self.weights[slot] = min(weight + seconds, SLOT_MEMORY_SECONDS)
+            start = end
+
+    def load_rows(self, rows):
+        """Fold in (ts, soc) rows sorted by time."""
+        for ts, soc in rows:
+            self.add(ts, soc)
+
+    def as_dict(self):
+        return {
+            "rates": self.rates,
+            "weights": self.weights,
+            "last_sample": self.last_sample,
+        }
+
+    def restore(self, data):
+        if len(data.get("rates", ())) != SLOTS_PER_WEEK:
+            return False
+        self.rates = list(data["rates"])
+        self.weights = list(data["weights"])
+        last = data.get("last_sample")
+        self.last_sample = tuple(last) if last else None
+        return True
+
+
+class ProfileSocModel:
+    """Integrates a snapshot of the profile forward from the latest sample."""
+
+    def __init__(self, rates, origin, soc):
+        self.rates = rates
+        # Epoch seconds and SoC of the sample the integration starts from
+        self.origin = origin
+        self.soc = soc
+
+    def predict(self, horizons, now=None):
+        """Return the predicted SoC for each horizon in seconds from now."""
+        now = time.time() if now is None else now
+        targets = sorted(
+            (now + horizon, index) for index, horizon in enumerate(horizons)
+        )
+        predicted = [None] * len(targets)
+        soc = self.soc
+        position = self.origin
+        for target, index in targets:
+            # Walk the slots between the last target and this one
+            while position < target:
+                slot, slot_begin = slot_start(position)
+                end = min(slot_begin + SLOT_SECONDS, target)
+                soc += self.rates[slot] * (end - position)
+                position = end
+            predicted[index] = round(min(max(soc, 0), 100), 2)
+        return predicted
@@ -0,0 +1,188 @@
+"""Streaming least-squares SoC trend, updated per sample without refits."""
+# soc_regression.py
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN
+from .soc_segments import CHARGING
+
+
+class StreamingLinearRegression:
+    """Least-squares line through the samples of a trailing window.
+
+    Keeps the weighted sums n, Σt, Σt², Σy and Σty so a sample is added or
+    expired in O(1) and the slope and intercept come from the closed form.
+    Times are kept relative to an origin that is moved up to the oldest
+    sample as the window slides, so the sums stay well conditioned. With a
+    half life older samples also fade out exponentially.
+    """
+
+    def __init__(self, window: timedelta, half_life: timedelta = None):
+        self.window = window.total_seconds()
+        self.half_life = half_life.total_seconds() if half_life else None
+        self._samples = deque()
+        self._origin = None
+        # Time the sums' weights are relative to, for exponential forgetting
+        self._weighted_at = None
+        self._sums = [0.0] * 5
+        self._expired = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def _weight(self, ts):
+        if self.half_life is None:
+            return 1.0
+        return 0.5 ** ((self._weighted_at - ts) / self.half_life)
+
+    def _accumulate(self, ts, soc, sign):
+        weight = sign * self._weight(ts)
+        t = ts - self._origin
+        sums = self._sums
+        sums[0] += weight
+        sums[1] += weight * t
+        sums[2] += weight * t * t
+        sums[3] += weight * soc
+        sums[4] += weight * t * soc
+
+    def _recompute(self):
+        # Rebase on the oldest sample and drop accumulated rounding error
+        self._origin = self._samples[0][0] if self._samples else None
+        self._sums = [0.0] * 5
+        for ts, soc in self._samples:
+            self._accumulate(ts, soc, 1)
+        self._expired = 0
+
+    def add(self, ts, soc):
+        """Fold in a sample and expire the ones that left the window."""
+        with self._lock:
+            if self._samples and ts <= self._samples[-1][0]:
+                return
+            if self._origin is None:
+                self._origin = ts
+            if self.half_life is not None:
+                if self._weighted_at is not None:
+                    decay = 0.5 ** ((ts - self._weighted_at) / self.half_life)
+                    self._sums = [value * decay for value in self._sums]
+                self._weighted_at = ts
+            self._samples.append((ts, soc))
+            self._accumulate(ts, soc, 1)
+
+            cutoff = ts - self.window
+            while self._samples[0][0] < cutoff:
+                self._accumulate(*self._samples.popleft(), -1)
+                self._expired += 1
+            if self._expired >= len(self._samples):
+                self._recompute()
+
+    def load_rows(self, rows):
+        """Fold in (ts, soc) rows sorted by time."""
+        for ts, soc in rows:
+            self.add(ts, soc)
+
+    def mean(self):
+        """Return the weighted mean SoC of the window, or None when empty."""
+        with self._lock:
+            return self._sums[3] / self._sums[0] if self._samples else None
+
+    def coefficients(self, now=None):
+        """Return (slope, intercept, origin) or None with fewer than two samples.
+
+        Samples older than the window at now are left out.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            cutoff = now - self.window
+            while self._samples and self._samples[0][0] < cutoff:
+                self._accumulate(*self._samples.popleft(), -1)
+                self._expired += 1
+            if len(self._samples) < 2:
+                return None
+            n, sum_t, sum_tt, sum_y, sum_ty = self._sums
+            denominator = n * sum_tt - sum_t * sum_t
+            if denominator <= 0:
+                return None
+            slope = (n * sum_ty - sum_t * sum_y) / denominator
+            intercept = (sum_y - slope * sum_t) / n
+            return slope, intercept, self._origin
+
+
+class StreamingSocModel:
+    """The streaming line evaluated like LinearSocModel, without numpy."""
+
+    def __init__(self, slope, intercept, origin):
+        self.slope = slope
+        self.intercept = intercept
+        self.origin = origin
+
+    def predict(self, horizons, now=None):
+        """Return the predicted SoC for each horizon in seconds from now."""
+        now = time.time() if now is None else now
+        # Cap the predicted SoC at 100% and format to two decimal places
+        return [
+            round(min(self.slope * (now + h - self.origin) + self.intercept, 100), 2)
+            for h in horizons
+        ]
+
+
+class SocRegressions:
+    """A streaming regression per lookback in use, fed every stored sample.
+
+    Samples the history labels as charging are left out, like the linear
+    fit, so the line follows the battery's usage.
+    """
+
+    def __init__(self, history, half_life: timedelta = None):
+        self._history = history
+        self._half_life = half_life
+        self._regressions = {}
+        # Orders registering against add(), so no sample is missed between
+        # the seed and the regression becoming visible
+        self._lock = threading.Lock()
+
+    def _load(self, regression, start_ts, end_ts):
+        timestamps, socs, labels = self._history.segments(start_ts, end_ts)
+        regression.load_rows(
+            (ts, soc)
+            for ts, soc, label in zip(timestamps, socs, labels)
+            if label != CHARGING
+        )
+        return timestamps[-1] if len(timestamps) else start_ts
+
+    def register(self, lookback: timedelta):
+        """Return the regression for lookback, seeded from the history on first use."""
+        regression = self._regressions.get(lookback)
+        if regression is not None:
+            return regression
+        regression = StreamingLinearRegression(lookback, self._half_life)
+        now = time.time()
+        seeded_to = self._load(regression, now - lookback.total_seconds(), now)
+        with self._lock:
+            if lookback in self._regressions:
+                return self._regressions[lookback]
+            # Samples appended since the seed, add() delivers the later ones
+            self._load(regression, seeded_to, float("inf"))
+            self._regressions[lookback] = regression
+        return regression
+
+    def reset(self):
+        """Drop the regressions so they are seeded again, e.g. after a backfill."""
+        with self._lock:
+            self._regressions = {}
+
+    def add(self, ts, soc):
+        """Fold in a sample the history has already labelled."""
+        _, _, labels = self._history.segments(ts, ts)
+        if len(labels) and labels[-1] == CHARGING:
+            return
+        with self._lock:
+            for regression in self._regressions.values():
+                regression.add(ts, soc)
+
+
+def get_soc_regressions(hass: HomeAssistant):
+    """Return the shared streaming regressions, or None before they are set up."""
+    return hass.data.get(DOMAIN, {}).get("soc_regressions")
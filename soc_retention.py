@@ -0,0 +1,205 @@
+"""Retention and downsampling of the SoC history."""
+# soc_retention.py
+import logging
+import time
+from datetime import datetime, timedelta
+from .soc_database import ROLLUP_TIERS
+
+_LOGGER = logging.getLogger(__name__)
+
+# Rows handled per writer job, small enough that queued inserts never wait long
+BATCH_SIZE = 2000
+
+ROLLUP_UPSERT_SQL = """INSERT INTO {table} (bucket, soc_min, soc_max, soc_first,
+    soc_last, increase, decrease, increases, decreases, samples)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(bucket) DO UPDATE SET
+    soc_min = min(soc_min, excluded.soc_min),
+    soc_max = max(soc_max, excluded.soc_max),
+    soc_last = excluded.soc_last,
+    increase = increase + excluded.increase,
+    decrease = decrease + excluded.decrease,
+    increases = increases + excluded.increases,
+    decreases = decreases + excluded.decreases,
+    samples = samples + excluded.samples"""
+
+
+def bucket_start(ts, seconds):
+    """Return the start of the bucket holding ts, days follow local midnight."""
+    if seconds >= 24 * 60 * 60:
+        day = datetime.fromtimestamp(ts).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        return int(day.timestamp())
+    return ts - ts % seconds
+
+
+def bucket_end(bucket, seconds):
+    """Return the start of the bucket after the one starting at bucket."""
+    if seconds >= 24 * 60 * 60:
+        # Days are 23 to 25 hours long around DST changes
+        return bucket_start(bucket + seconds + 2 * 60 * 60, seconds)
+    return bucket + seconds
+
+
+def get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM soc_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(conn, key, value):
+    conn.execute(
+        "INSERT OR REPLACE INTO soc_meta (key, value) VALUES (?, ?)", (key, value)
+    )
+
+
+def rollup_batch(conn, until_ts, batch_size=BATCH_SIZE):
+    """Fold the next batch of raw samples older than until_ts into every tier.
+
+    Each sample's change from the previous sample is credited to the bucket of
+    the later sample, the last rolled up sample is kept in soc_meta so deltas
+    carry across batches. Returns the number of samples rolled up.
+    """
+    watermark = get_meta(conn, "rollup_ts", -1)
+    previous = get_meta(conn, "rollup_soc")
+    rows = conn.execute(
+        "SELECT ts, soc FROM soc_data WHERE ts > ? AND ts < ? ORDER BY ts LIMIT ?",
+        (watermark, until_ts, batch_size),
+    ).fetchall()
+    if not rows:
+        return 0
+
+    rollup_rows(conn, rows, previous)
+    set_meta(conn, "rollup_ts", rows[-1][0])
+    set_meta(conn, "rollup_soc", rows[-1][1])
+    return len(rows)
+
+
+def rollup_rows(conn, rows, previous=None):
+    """Upsert (ts, soc) rows sorted by time into every rollup tier.
+
+    previous is the SoC of the sample before the first row, if there is one.
+    """
+    for table, seconds, _ in ROLLUP_TIERS:
+        rollup_tier(conn, table, seconds, rows, previous)
+
+
+def rollup_tier(conn, table, seconds, rows, previous=None):
+    """Upsert (ts, soc) rows sorted by time into one rollup table."""
+    buckets = {}
+    previous_soc = previous
+    for ts, soc in rows:
+        bucket = bucket_start(ts, seconds)
+        row = buckets.get(bucket)
+        if row is None:
+            row = [bucket, soc, soc, soc, soc, 0.0, 0.0, 0, 0, 0]
+            buckets[bucket] = row
+        row[1] = min(row[1], soc)
+        row[2] = max(row[2], soc)
+        row[4] = soc
+        row[9] += 1
+        if previous_soc is not None:
+            change = soc - previous_soc
+            if change > 0:
+                row[5] += change
+                row[7] += 1
+            elif change < 0:
+                row[6] -= change
+                row[8] += 1
+        previous_soc = soc
+    conn.executemany(ROLLUP_UPSERT_SQL.format(table=table), buckets.values())
+
+
+def merge_rollup_rows(conn, rows, until_ts):
+    """Fold rows inserted behind the rollup watermark into every tier.
+
+    rows are sorted by time. A bucket that still has all of its raw samples is
+    rebuilt from soc_data, which keeps its first and last SoC and its changes
+    right, buckets with pruned samples only get the rows added.
+    """
+    for table, seconds, _ in ROLLUP_TIERS:
+        added = {}
+        for ts, soc in rows:
+            added.setdefault(bucket_start(ts, seconds), []).append((ts, soc))
+        for bucket, bucket_rows in added.items():
+            end = min(bucket_end(bucket, seconds), until_ts + 1)
+            stored = conn.execute(
+                f"SELECT samples FROM {table} WHERE bucket = ?", (bucket,)
+            ).fetchone()
+            raw = conn.execute(
+                "SELECT ts, soc FROM soc_data WHERE ts >= ? AND ts < ? ORDER BY ts",
+                (bucket, end),
+            ).fetchall()
+            if (stored[0] if stored else 0) + len(bucket_rows) == len(raw):
+                conn.execute(f"DELETE FROM {table} WHERE bucket = ?", (bucket,))
+                bucket_rows = raw
+            previous = conn.execute(
+                "SELECT soc FROM soc_data WHERE ts < ? ORDER BY ts DESC LIMIT 1",
+                (bucket_rows[0][0],),
+            ).fetchone()
+            previous = previous[0] if previous else None
+            rollup_tier(conn, table, seconds, bucket_rows, previous)
+
+
+def prune_batch(conn, table, key, cutoff, batch_size=BATCH_SIZE):
+    """Delete up to batch_size rows with key older than cutoff, return the count."""
+    cursor = conn.execute(
+        f"DELETE FROM {table} WHERE {key} IN "
+        f"(SELECT {key} FROM {table} WHERE {key} < ? ORDER BY {key} LIMIT ?)",
+        (cutoff, batch_size),
+    )
+    return cursor.rowcount
+
+
+class SocRetentionJob:
+    """A retention pass, run on the SoC writer thread one batch at a time.
+
+    Closed five minute buckets are rolled up first, then raw samples older
+    than the raw retention window are pruned (never past the rollup
+    watermark), then each rollup tier is pruned to its own retention. Old
+    month files of an archive go last.
+    """
+
+    def __init__(self, raw_retention: timedelta, batch_size=BATCH_SIZE, archive=None):
+        self._raw_retention = raw_retention
+        self._archive = archive
+        self._batch_size = batch_size
+        self._rolling_up = True
+
+    def __call__(self, conn):
+        now = int(time.time())
+        if self._rolling_up:
+            until_ts = bucket_start(now, ROLLUP_TIERS[0][1])
+            rolled_up = rollup_batch(conn, until_ts, self._batch_size)
+            if rolled_up == self._batch_size:
+                return True
+            self._rolling_up = False
+
+        # Only prune samples that have already been rolled up
+        raw_cutoff = min(
+            now - int(self._raw_retention.total_seconds()),
+            get_meta(conn, "rollup_ts", -1) + 1,
+        )
+        pruned = prune_batch(conn, "soc_data", "ts", raw_cutoff, self._batch_size)
+        if pruned == self._batch_size:
+            return True
+        # Raw samples before this are gone, the in-memory history starts here
+        pruned_before = max(raw_cutoff, get_meta(conn, "pruned_before", 0))
+        set_meta(conn, "pruned_before", pruned_before)
+
+        for table, _, keep_days in ROLLUP_TIERS:
+            if keep_days is None:
+                continue
+            cutoff = now - keep_days * 24 * 60 * 60
+            pruned = prune_batch(conn, table, "bucket", cutoff, self._batch_size)
+            if pruned == self._batch_size:
+                return True
+
+        if self._archive is not None:
+            try:
+                self._archive.prune(now)
+            except OSError as e:
+                _LOGGER.error(f"Error pruning the SoC archive: {e}")
+
+        _LOGGER.info("SoC retention pass finished")
+        return False
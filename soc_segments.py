@@ -0,0 +1,107 @@
+"""Label SoC samples as charging, discharging or idle.
+
+Only the standard library and numpy, so the backtest can import it outside
+Home Assistant.
+"""
+# soc_segments.py
+import math
+
+CHARGING = 1
+IDLE = 0
+DISCHARGING = -1
+
+# Consecutive moves one way needed before the state switches, shorter runs
+# keep the state they interrupt
+MIN_RUN = 2
+
+# SoC is compared in steps of this many % points, so smaller moves count as
+# flat. The same 1% as the capture's default deadband
+DEADBAND = 1.0
+
+
+def soc_level(soc, deadband=DEADBAND):
+    return math.floor(soc / deadband) if deadband > 0 else soc
+
+
+def segment_soc(socs, min_run=MIN_RUN, deadband=DEADBAND):
+    """Return an int8 label per sample, CHARGING, DISCHARGING or IDLE.
+
+    Flat steps are dropped and the signs of the remaining moves run-length
+    encoded, so pauses within a charge don't break it up. The state switches
+    on the move that completes a run of min_run, shorter runs keep the state
+    before them (hysteresis). Every sample takes the state after the last
+    move up to it, samples before the first move are IDLE. Gives the same
+    labels as feeding the samples through a SocSegmenter.
+    """
+    import numpy as np
+
+    socs = np.asarray(socs, dtype=float)
+    labels = np.zeros(len(socs), dtype=np.int8)
+    if len(socs) < 2:
+        return labels
+    levels = np.floor(socs / deadband) if deadband > 0 else socs
+    signs = np.sign(np.diff(levels)).astype(np.int8)
+    moves = np.flatnonzero(signs)
+    if not len(moves):
+        return labels
+
+    # Run-length encode the signs of the moves
+    move_signs = signs[moves]
+    boundaries = np.flatnonzero(move_signs[1:] != move_signs[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    lengths = np.diff(np.concatenate((starts, [len(move_signs)])))
+    values = move_signs[starts]
+
+    # Runs of min_run or more switch the state, the first run always does
+    settled = lengths >= min_run
+    settled[0] = True
+    source = np.maximum.accumulate(np.where(settled, np.arange(len(values)), 0))
+    before = np.concatenate(([0], source[:-1]))
+    move_labels = np.repeat(values[source], lengths)
+    # Until the move that completes it, a settled run keeps the state before it
+    position = np.arange(len(move_signs)) - np.repeat(starts, lengths)
+    early = np.repeat(settled & (np.arange(len(values)) > 0), lengths) & (
+        position < min_run - 1
+    )
+    move_labels[early] = np.repeat(values[before], lengths)[early]
+
+    # Move i lands on sample moves[i] + 1, later samples keep its label
+    labels[moves + 1] = move_labels
+    last_move = np.maximum.accumulate(
+        np.where(labels != 0, np.arange(len(socs)), 0)
+    )
+    labels[moves[0] + 1 :] = labels[last_move[moves[0] + 1 :]]
+    return labels
+
+
+class SocSegmenter:
+    """segment_soc one sample at a time, in O(1) per sample without numpy."""
+
+    def __init__(self, min_run=MIN_RUN, deadband=DEADBAND):
+        self._min_run = min_run
+        self._deadband = deadband
+        self._level = None
+        self._run_sign = 0
+        self._run_length = 0
+        self.label = IDLE
+
+    def copy(self):
+        segmenter = SocSegmenter(self._min_run, self._deadband)
+        segmenter.__dict__.update(self.__dict__)
+        return segmenter
+
+    def add(self, soc):
+        """Fold in the next sample and return its label."""
+        level = soc_level(soc, self._deadband)
+        previous, self._level = self._level, level
+        if previous is None or level == previous:
+            return self.label
+        sign = CHARGING if level > previous else DISCHARGING
+        if sign == self._run_sign:
+            self._run_length += 1
+        else:
+            self._run_sign = sign
+            self._run_length = 1
+        if self.label == IDLE or self._run_length >= self._min_run:
+            self.label = sign
+        return self.label
@@ -0,0 +1,27 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+from battery_automation import battery_predictions
+from battery_automation.battery_predictions import (
+    MODEL_LINEAR,
+    LinearSocModel,
+    predict_future_state,
+)
+from battery_automation.prediction_cache import get_prediction_cache
+
+T0 = 1700000000
+
+
+def test_prediction_follows_the_clock_between_samples(hass, monkeypatch):
+    hass.data["battery_automation"]["soc_history"] = SimpleNamespace(version=1)
+    lookback = timedelta(days=1)
+    # One % an hour down from 80% at T0, cached as the fit for this version
+    model = LinearSocModel(-1 / 3600, 80, T0)
+    key = (MODEL_LINEAR, lookback.total_seconds(), 1, None)
+    get_prediction_cache(hass).get_or_compute(key, lambda: model)
+
+    now = [T0]
+    monkeypatch.setattr(battery_predictions, "to_epoch", lambda moment: now[0])
+    assert predict_future_state(hass, timedelta(hours=1), lookback) == 79.0
+    now[0] = T0 + 15 * 60
+    assert predict_future_state(hass, timedelta(hours=1), lookback) == 78.75
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from battery_automation.battery_soc_calcs import summarise_windows
+
+NOW = 1700000000
+HOUR = timedelta(hours=1)
+THREE_HOURS = timedelta(hours=3)
+
+
+def test_window_without_samples_has_zero_totals():
+    timestamps = [NOW - 7200, NOW - 7000, NOW - 6800]
+    results = summarise_windows(timestamps, [60, 58, 59], NOW, [HOUR, THREE_HOURS])
+    assert results[HOUR] == (0, 0.0, 0, 0.0, 0)
+    assert results[THREE_HOURS] == (3, 1.0, 1, 2.0, 1)
+
+
+def test_window_with_one_sample_has_no_changes():
+    results = summarise_windows([NOW - 7200, NOW - 60], [60, 58], NOW, [HOUR])
+    assert results[HOUR] == (1, 0.0, 0, 0.0, 0)
+
+
+def test_carry_forward_window_keeps_the_sample_in_force():
+    timestamps = [NOW - 7200, NOW - 7000]
+    results = summarise_windows(timestamps, [60, 58], NOW, [HOUR], True)
+    assert results[HOUR] == (1, 0.0, 0, 0.0, 0)
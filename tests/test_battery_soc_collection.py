@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from battery_automation import battery_soc_collection
+from battery_automation.battery_soc_collection import SocCapture
+
+T0 = 1700000000
+
+
+def make_capture(hass, monkeypatch):
+    stored = []
+
+    def insert(hass, soc, timestamp):
+        stored.append(soc)
+        hass.data["battery_automation"]["last_soc_sample"] = (T0, soc)
+
+    monkeypatch.setattr(battery_soc_collection, "insert_soc_data", insert)
+    capture = SocCapture(hass, "sensor.battery", 1.0, timedelta(minutes=15))
+    return capture, stored
+
+
+def state_changed(capture, state):
+    new_state = SimpleNamespace(state=state, last_updated=datetime.now())
+    capture._async_state_changed(SimpleNamespace(data={"new_state": new_state}))
+
+
+def test_changes_inside_the_deadband_are_skipped(hass, monkeypatch):
+    capture, stored = make_capture(hass, monkeypatch)
+    for state in ("50.0", "50.5", "49.1", "49.0", "unavailable", "48.0"):
+        state_changed(capture, state)
+    assert stored == [50.0, 49.0, 48.0]
+
+
+def test_every_change_is_stored_during_a_charge_slot(hass, monkeypatch):
+    capture, stored = make_capture(hass, monkeypatch)
+    slot = (datetime.now() - timedelta(minutes=5)).strftime("%H:%M:%S")
+    hass.data["battery_automation"].update(
+        charging_control_enabled=True, slot_times=[slot]
+    )
+    for state in ("50.0", "50.5", "51.0"):
+        state_changed(capture, state)
+    assert stored == [50.0, 50.5, 51.0]
+
+
+def test_heartbeat_only_samples_when_due(hass, monkeypatch):
+    capture, _ = make_capture(hass, monkeypatch)
+    collected = []
+
+    async def collect(hass):
+        collected.append(True)
+
+    monkeypatch.setattr(battery_soc_collection, "collect_soc_data", collect)
+    hass.data["battery_automation"]["last_soc_sample"] = (T0, 50.0)
+    moment = datetime.fromtimestamp(T0)
+    asyncio.run(capture._async_heartbeat(moment + timedelta(minutes=5)))
+    assert collected == []
+    asyncio.run(capture._async_heartbeat(moment + timedelta(minutes=15)))
+    assert collected == [True]
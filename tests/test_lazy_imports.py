@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+from conftest import PACKAGE, ROOT
+
+# The standalone backtest
+SKIPPED = {"__init__", "backtest"}
+
+
+def integration_modules():
+    modules = [PACKAGE]
+    for module in sorted(os.listdir(ROOT)):
+        module, extension = os.path.splitext(module)
+        if extension == ".py" and module not in SKIPPED:
+            modules.append(f"{PACKAGE}.{module}")
+    for module in sorted(os.listdir(os.path.join(ROOT, "sensors"))):
+        module, extension = os.path.splitext(module)
+        if extension == ".py" and module != "__init__":
+            modules.append(f"{PACKAGE}.sensors.{module}")
+    return modules
+
+
+def test_importing_the_integration_skips_numpy_and_sklearn():
+    # A fresh interpreter, this one has numpy loaded by other tests
+    script = (
+        "import importlib, sys\n"
+        f"sys.path.insert(0, {os.path.dirname(__file__)!r})\n"
+        "import conftest\n"
+        f"for name in {integration_modules()!r}:\n"
+        "    importlib.import_module(name)\n"
+        "print(sorted({'numpy', 'sklearn'} & set(sys.modules)))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
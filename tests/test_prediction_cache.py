@@ -0,0 +1,20 @@
+from battery_automation.prediction_cache import PredictionCache
+
+
+def test_hits_skip_the_computation_and_old_entries_age_out():
+    cache = PredictionCache(max_entries=2)
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value
+
+    assert cache.get_or_compute("a", lambda: compute(1)) == 1
+    assert cache.get_or_compute("a", lambda: compute(2)) == 1
+    cache.get_or_compute("b", lambda: compute(3))
+    # "a" was used more recently than "b", so "b" is evicted for "c"
+    cache.get_or_compute("a", lambda: compute(4))
+    cache.get_or_compute("c", lambda: compute(5))
+    assert len(cache) == 2
+    assert cache.get_or_compute("b", lambda: compute(6)) == 6
+    assert calls == [1, 3, 5, 6]
@@ -0,0 +1,68 @@
+import asyncio
+
+import battery_automation
+from battery_automation import octopus_api
+
+
+class RatesStore:
+    async def async_save(self, rates_import, fetched_at):
+        pass
+
+
+def setup_rates(hass, monkeypatch, fetch):
+    hass.data["battery_automation"].update(
+        rates_data={}, rates_lock=asyncio.Lock(), rates_store=RatesStore()
+    )
+    monkeypatch.setattr(battery_automation, "fetch_unit_rates", fetch)
+    monkeypatch.setattr(battery_automation, "get_octopus_client", lambda hass: None)
+    monkeypatch.setattr(battery_automation, "get_tariff_cache", lambda hass: None)
+    monkeypatch.setattr(octopus_api, "build_rate_views", lambda *args: {})
+
+
+def test_rate_refreshes_never_overlap(hass, monkeypatch):
+    running = []
+    overlapped = []
+
+    async def fetch(client, account_id, tariff_cache):
+        overlapped.append(bool(running))
+        running.append(True)
+        await asyncio.sleep(0.01)
+        running.pop()
+        return []
+
+    setup_rates(hass, monkeypatch, fetch)
+
+    async def refresh_twice():
+        return await asyncio.gather(
+            battery_automation.async_refresh_rates(hass, "A-1"),
+            battery_automation.async_refresh_rates(hass, "A-1"),
+        )
+
+    assert asyncio.run(refresh_twice()) == [True, True]
+    assert overlapped == [False, False]
+
+
+def test_unload_cancels_rate_retries(hass, monkeypatch):
+    async def fetch(client, account_id, tariff_cache):
+        return None
+
+    setup_rates(hass, monkeypatch, fetch)
+    monkeypatch.setattr(battery_automation, "RATES_RETRY_SECONDS", 0.01)
+
+    class ConfigEntries:
+        async def async_unload_platforms(self, entry, platforms):
+            return True
+
+    async def run():
+        hass.async_create_task = asyncio.ensure_future
+        hass.config_entries = ConfigEntries()
+        task = battery_automation.track_rate_task(
+            hass, battery_automation.get_tariff_background(None, "A-1", hass)
+        )
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        await battery_automation.async_unload_entry(hass, None)
+        await asyncio.sleep(0)
+        return task
+
+    assert asyncio.run(run()).cancelled()
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import battery_automation
+from battery_automation import octopus_api
+
+
+def half_hours(day):
+    start = datetime.combine(day, datetime.min.time())
+    return [
+        {
+            "value_inc_vat": 20.0,
+            "valid_from": (start + timedelta(minutes=30 * i)).isoformat(),
+            "valid_to": (start + timedelta(minutes=30 * (i + 1))).isoformat(),
+        }
+        for i in range(48)
+    ]
+
+
+def test_local_update_rebuilds_the_date_views_after_midnight(hass, monkeypatch):
+    yesterday = datetime.now().date() - timedelta(days=1)
+    today = yesterday + timedelta(days=1)
+    rates_import = half_hours(yesterday) + half_hours(today)
+
+    # Views built yesterday evening, Octopus unreachable since
+    class Yesterday(datetime):
+        @classmethod
+        def now(cls):
+            return datetime.combine(yesterday, datetime.min.time()) + timedelta(
+                hours=20
+            )
+
+    monkeypatch.setattr(octopus_api, "datetime", Yesterday)
+    hass.data["battery_automation"]["rates_data"] = octopus_api.store_rate_views(
+        rates_import
+    )
+    hass.data["battery_automation"]["rates_raw"] = rates_import
+    assert hass.data["battery_automation"]["rates_data"]["afternoon_today"][0][
+        "Date"
+    ] == yesterday.strftime("%d-%m-%Y")
+
+    monkeypatch.undo()
+    battery_automation.update_local_rates_data(hass)
+    rates_data = hass.data["battery_automation"]["rates_data"]
+    assert rates_data["afternoon_today"][0]["Date"] == today.strftime("%d-%m-%Y")
+    assert rates_data["afternoon_tomorrow"] == []
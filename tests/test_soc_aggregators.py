@@ -0,0 +1,97 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from battery_automation.battery_soc_calcs import calculate_usage_statistics
+from battery_automation.soc_aggregators import SocAggregators
+from battery_automation.soc_history import SocHistory
+
+PERIODS = [timedelta(hours=6), timedelta(days=1)]
+
+
+def soc_series(start, count, seed):
+    """A minute series draining by day, charging at night, with some noise."""
+    rng = np.random.default_rng(seed)
+    soc = 80.0
+    rows = []
+    for i in range(count):
+        ts = start + 60 * i
+        charging = (ts // 3600) % 24 < 4
+        soc = min(soc + 0.5, 100) if charging else max(soc - 0.08, 5)
+        rows.append((float(ts), round(soc + rng.normal(0, 0.3), 1)))
+    return rows
+
+
+def make_aggregators(hass, rows, now):
+    history = SocHistory()
+    history.load(rows, now - 8 * 24 * 3600)
+    hass.data["battery_automation"]["soc_history"] = history
+
+    async def add_executor_job(func, *args):
+        return func(*args)
+
+    hass.async_add_executor_job = add_executor_job
+    return history, SocAggregators(hass, history)
+
+
+def totals(aggregators, periods):
+    return asyncio.run(aggregators.async_totals(periods))
+
+
+def test_rolling_totals_match_a_full_recalculation(hass):
+    now = time.time()
+    # Half a minute off the clock, so no sample sits on a window boundary
+    rows = soc_series(int(now) - 2 * 24 * 3600 + 30, 2 * 24 * 60 - 120, seed=0)
+    history, aggregators = make_aggregators(hass, rows, now)
+    totals(aggregators, PERIODS)
+
+    for ts, soc in soc_series(int(rows[-1][0]) + 60, 100, seed=1):
+        history.append(ts, soc)
+        aggregators.advance(ts)
+
+    rolling = totals(aggregators, PERIODS)
+    expected = calculate_usage_statistics(hass, PERIODS)
+    for period in PERIODS:
+        assert rolling[period][0] == expected[period][0]
+        assert rolling[period][1:] == pytest.approx(expected[period][1:])
+        # Noise while discharging doesn't count as charge
+        assert rolling[period][2] < rolling[period][4]
+
+
+def test_window_without_samples_reports_none(hass):
+    now = time.time()
+    # A flat spell, the last samples were stored over an hour ago
+    rows = [(now - 7200 + 60 * i, 50.0 - i) for i in range(5)]
+    history, aggregators = make_aggregators(hass, rows, now)
+    hour = timedelta(hours=1)
+    result = totals(aggregators, [hour, timedelta(hours=3)])
+    assert result[hour] == (0, 0.0, 0, 0.0, 0)
+    assert result[timedelta(hours=3)] == (5, 0.0, 0, 4.0, 4)
+
+
+def test_expired_samples_leave_the_window(hass):
+    now = time.time()
+    rows = [(now - 3000 + 60 * i, 50.0 - i) for i in range(5)]
+    history, aggregators = make_aggregators(hass, rows, now)
+    hour = timedelta(hours=1)
+    assert totals(aggregators, [hour])[hour] == (5, 0.0, 0, 4.0, 4)
+
+    # Samples arriving after every earlier one has expired
+    later = now + 3600
+    history.append(later, 40.0)
+    aggregators.advance(later)
+    aggregator = aggregators.register(hour)
+    assert aggregator.totals() == (1, 0.0, 0, 0.0, 0)
+
+
+def test_samples_leave_seeding_to_the_executor(hass):
+    now = time.time()
+    rows = [(now - 600 + 60 * i, 50.0) for i in range(5)]
+    history, aggregators = make_aggregators(hass, rows, now)
+    aggregator = aggregators.register(timedelta(hours=1))
+    history.append(now + 60, 49.0)
+    aggregators.advance(now + 60)
+    assert aggregator.needs_seed(history)
@@ -0,0 +1,50 @@
+from battery_automation.soc_archive import SocArchive
+
+T0 = 1700000000
+
+
+def make_archive(tmp_path, timestamps):
+    archive = SocArchive(str(tmp_path / "archive"))
+    for ts in timestamps:
+        archive.append(ts, 50.0)
+    archive.close()
+    return archive
+
+
+def test_read_arrays_window(tmp_path):
+    archive = make_archive(tmp_path, (T0, T0 + 60, T0 + 120, T0 + 180))
+    timestamps, socs = archive.read_arrays(T0 + 30, T0 + 150)
+    assert timestamps.tolist() == [T0 + 60, T0 + 120]
+    assert socs.tolist() == [50.0, 50.0]
+
+
+def test_carry_forward_adds_sample_in_force(tmp_path):
+    archive = make_archive(tmp_path, (T0, T0 + 60, T0 + 120))
+    timestamps, _ = archive.read_arrays(T0 + 90, T0 + 150, carry_forward=True)
+    assert timestamps.tolist() == [T0 + 60, T0 + 120]
+
+
+def test_carry_forward_sample_at_start(tmp_path):
+    archive = make_archive(tmp_path, (T0, T0 + 60, T0 + 120))
+    timestamps, _ = archive.read_arrays(T0 + 60, T0 + 150, carry_forward=True)
+    assert timestamps.tolist() == [T0 + 60, T0 + 120]
+
+
+def test_carry_forward_from_previous_month(tmp_path):
+    # 1698796800 is 2023-11-01 00:00 UTC
+    archive = make_archive(tmp_path, (1698796800 - 60, 1698796800 + 60))
+    timestamps, _ = archive.read_arrays(1698796800, 1698796900, carry_forward=True)
+    assert timestamps.tolist() == [1698796800 - 60, 1698796800 + 60]
+
+
+def test_append_after_torn_record(tmp_path):
+    archive = make_archive(tmp_path, (T0, T0 + 60))
+    path = archive._path(archive.months()[0])
+    with open(path, "ab") as torn:
+        torn.write(b"\x01\x02\x03")
+    archive = SocArchive(str(tmp_path / "archive"))
+    archive.append(T0 + 120, 40.0)
+    archive.close()
+    timestamps, socs = archive.read_arrays(T0, T0 + 180)
+    assert timestamps.tolist() == [T0, T0 + 60, T0 + 120]
+    assert socs.tolist() == [50.0, 50.0, 40.0]
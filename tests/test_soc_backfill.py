@@ -0,0 +1,127 @@
+import asyncio
+import sqlite3
+from datetime import timedelta
+from types import SimpleNamespace
+
+from battery_automation import soc_backfill
+from battery_automation.soc_backfill import store_backfill_chunk
+from battery_automation.soc_database import (
+    ROLLUP_TIERS,
+    SocDataWriter,
+    get_database_path,
+    init_database,
+)
+from battery_automation.soc_retention import get_meta, rollup_batch
+
+T0 = 1700000000
+
+
+def rollups(conn):
+    return {
+        table: conn.execute(f"SELECT * FROM {table} ORDER BY bucket").fetchall()
+        for table, _, _ in ROLLUP_TIERS
+    }
+
+
+def open_database(hass):
+    init_database(hass)
+    return sqlite3.connect(get_database_path(hass))
+
+
+def test_backfill_rolls_up_only_inserted_rows(hass, tmp_path):
+    live = [(T0 + 60 * i, 80 - i * 0.5) for i in range(20)]
+    recorder = [(T0 - 60 * i, 90 + i) for i in range(10, 0, -1)]
+    # The recorder also saw the first live samples, with other values
+    recorder += [(T0, 10.0), (T0 + 60, 99.0)]
+
+    conn = open_database(hass)
+    conn.executemany("INSERT INTO soc_data (ts, soc) VALUES (?, ?)", live)
+    rollup_batch(conn, T0 + 3600)
+    store_backfill_chunk(conn, recorder, T0)
+    conn.commit()
+
+    # The same samples rolled up in one pass
+    expected = sqlite3.connect(":memory:")
+    for statement in conn.iterdump():
+        if not statement.startswith("INSERT INTO \"soc_rollup"):
+            expected.execute(statement)
+    expected.execute("DELETE FROM soc_meta")
+    rollup_batch(expected, T0 + 3600)
+
+    assert conn.execute(
+        "SELECT soc FROM soc_data WHERE ts IN (?, ?) ORDER BY ts", (T0, T0 + 60)
+    ).fetchall() == [(80.0,), (79.5,)]
+    assert get_meta(conn, "backfill_ts") == T0
+    assert rollups(conn) == rollups(expected)
+
+
+def test_backfill_adds_to_buckets_with_pruned_samples(hass):
+    conn = open_database(hass)
+    conn.executemany(
+        "INSERT INTO soc_data (ts, soc) VALUES (?, ?)",
+        [(T0 + 60 * i, 50.0) for i in range(3)],
+    )
+    rollup_batch(conn, T0 + 3600)
+    conn.execute("DELETE FROM soc_data WHERE ts < ?", (T0 + 120,))
+    store_backfill_chunk(conn, [(T0 + 30, 40.0)], T0 + 60)
+
+    samples, soc_min = conn.execute(
+        "SELECT samples, soc_min FROM soc_rollup_5m WHERE bucket = ?",
+        (T0 - T0 % 300,),
+    ).fetchone()
+    assert (samples, soc_min) == (3, 40.0)
+
+
+def run_backfill(hass, monkeypatch, fail_chunk):
+    """Run a three day backfill whose chunk starting at fail_chunk fails."""
+    init_database(hass)
+    writer = SocDataWriter(get_database_path(hass))
+    writer.start()
+    hass.data["battery_automation"]["soc_writer"] = writer
+    hass.config.components = {"recorder"}
+
+    async def add_executor_job(func, *args):
+        return func(*args)
+
+    hass.async_add_executor_job = add_executor_job
+    monkeypatch.setattr(
+        soc_backfill,
+        "get_instance",
+        lambda hass: SimpleNamespace(async_add_executor_job=add_executor_job),
+    )
+    monkeypatch.setattr(soc_backfill, "BACKFILL_SPAN", timedelta(days=3))
+    monkeypatch.setattr(
+        soc_backfill,
+        "fetch_recorder_rows",
+        lambda hass, entity_id, start, end: [(start, 50.0), (start + 60, 49.0)],
+    )
+
+    def store_chunk(conn, rows, chunk_end, archive=None):
+        if rows[0][0] == fail_chunk:
+            raise sqlite3.OperationalError("disk I/O error")
+        return store_backfill_chunk(conn, rows, chunk_end, archive)
+
+    monkeypatch.setattr(soc_backfill, "store_backfill_chunk", store_chunk)
+    # Live samples from T0 on, the backfill fills the three days before
+    writer.insert(T0, 60.0)
+    writer.flush()
+    try:
+        asyncio.run(soc_backfill.async_run_backfill(hass, "sensor.battery"))
+    finally:
+        writer.close()
+    return hass.data["battery_automation"]["soc_backfill"]
+
+
+def test_failed_chunk_stops_the_backfill(hass, monkeypatch):
+    day = 24 * 3600
+    backfill = run_backfill(hass, monkeypatch, fail_chunk=T0 - 2 * day)
+
+    conn = sqlite3.connect(get_database_path(hass))
+    assert backfill.status == "failed"
+    # Only the first chunk was stored and the watermark stops at its end
+    assert get_meta(conn, "backfill_ts") == T0 - 2 * day
+    assert conn.execute("SELECT ts FROM soc_data ORDER BY ts").fetchall() == [
+        (T0 - 3 * day,),
+        (T0 - 3 * day + 60,),
+        (T0,),
+    ]
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from battery_automation import soc_database
+from battery_automation.soc_archive import SocArchive
+from battery_automation.soc_database import (
+    SCHEMA_VERSION,
+    SocDataWriter,
+    SocReadPool,
+    get_database_path,
+    init_database,
+)
+
+T0 = 1700000000
+
+
+def test_writer_commits_and_archives(hass, tmp_path):
+    init_database(hass)
+    archive = SocArchive(str(tmp_path / "archive"))
+    writer = SocDataWriter(get_database_path(hass), archive)
+    writer.start()
+    writer.insert(T0, 50.0)
+    writer.insert(T0 + 60, 49.5)
+    writer.close()
+
+    conn = sqlite3.connect(get_database_path(hass))
+    assert conn.execute("SELECT ts, soc FROM soc_data ORDER BY ts").fetchall() == [
+        (T0, 50.0),
+        (T0 + 60, 49.5),
+    ]
+    assert archive.read_arrays(T0, T0 + 60)[0].tolist() == [T0, T0 + 60]
+
+
+def test_failed_write_keeps_rows_for_retry(hass, tmp_path, monkeypatch):
+    monkeypatch.setattr(soc_database, "WRITE_RETRY_SECONDS", 0)
+    db_path = str(tmp_path / "soc_data.db")
+    archive = SocArchive(str(tmp_path / "archive"))
+    writer = SocDataWriter(db_path, archive)
+    writer.start()
+    # No soc_data table yet, so the first commit fails
+    writer.insert(T0, 50.0)
+    writer.flush()
+    assert writer.pending() == [(T0, 50.0)]
+    assert len(archive.read_arrays(T0, T0)[0]) == 0
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(soc_database.CREATE_SOC_TABLE_SQL)
+    conn.commit()
+    writer.insert(T0 + 60, 49.5)
+    writer.close()
+
+    assert writer.pending() == []
+    assert conn.execute("SELECT ts, soc FROM soc_data ORDER BY ts").fetchall() == [
+        (T0, 50.0),
+        (T0 + 60, 49.5),
+    ]
+    assert archive.read_arrays(T0, T0 + 60)[0].tolist() == [T0, T0 + 60]
+
+
+def test_failing_job_keeps_the_writer_running(hass):
+    init_database(hass)
+    writer = SocDataWriter(get_database_path(hass))
+    writer.start()
+
+    def broken(conn):
+        conn.execute("INSERT INTO soc_data (ts, soc) VALUES (?, ?)", (T0, 50.0))
+        raise ValueError("bad job")
+
+    writer.submit(broken)
+    writer.insert(T0 + 60, 49.5)
+    writer.flush()
+    writer.close()
+
+    conn = sqlite3.connect(get_database_path(hass))
+    # The failed job was rolled back, the sample after it still committed
+    assert conn.execute("SELECT ts, soc FROM soc_data").fetchall() == [
+        (T0 + 60, 49.5)
+    ]
+
+
+def test_migrates_text_timestamps_in_place(hass):
+    db_path = get_database_path(hass)
+    os.makedirs(os.path.dirname(db_path))
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE soc_data (timestamp TEXT, soc REAL)")
+    moment = datetime.fromtimestamp(T0)
+    conn.execute("INSERT INTO soc_data VALUES (?, ?)", (moment.isoformat(), 42.0))
+    conn.commit()
+    conn.close()
+
+    init_database(hass)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute("SELECT ts, soc FROM soc_data").fetchall() == [(T0, 42.0)]
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    assert {"soc_rollup_5m", "soc_rollup_1h", "soc_rollup_1d", "soc_meta"} <= tables
+
+
+def test_read_pool_is_read_only_and_sees_commits(hass):
+    init_database(hass)
+    writer = SocDataWriter(get_database_path(hass))
+    writer.start()
+    pool = SocReadPool(get_database_path(hass))
+    conn = pool.connection()
+    assert pool.connection() is conn
+    assert conn.execute("SELECT COUNT(*) FROM soc_data").fetchone()[0] == 0
+
+    writer.insert(T0, 50.0)
+    writer.flush()
+    assert conn.execute("SELECT soc FROM soc_data").fetchall() == [(50.0,)]
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO soc_data (ts, soc) VALUES (?, ?)", (T0 + 60, 1.0))
+    writer.close()
+    pool.close()
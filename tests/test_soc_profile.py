@@ -0,0 +1,34 @@
+import sqlite3
+import time
+
+from battery_automation.soc_database import get_database_path, init_database
+from battery_automation.soc_profile import seed_soc_profile
+from battery_automation.soc_rate_profile import SocProfile, slot_start
+from battery_automation.soc_retention import rollup_batch
+
+DAY = 24 * 3600
+
+
+def test_seed_reaches_past_the_raw_retention(hass):
+    now = int(time.time())
+    # Minute samples for ten days, draining only during one hour nine days ago
+    drain_start = now - 9 * DAY
+    rows = []
+    soc = 90.0
+    for ts in range(now - 10 * DAY, now - 60, 60):
+        if drain_start <= ts < drain_start + 3600:
+            soc -= 0.1
+        rows.append((ts, round(soc, 1)))
+
+    init_database(hass)
+    conn = sqlite3.connect(get_database_path(hass))
+    conn.executemany("INSERT INTO soc_data (ts, soc) VALUES (?, ?)", rows)
+    rollup_batch(conn, now, batch_size=len(rows))
+    # Raw retention has pruned everything older than a week
+    conn.execute("DELETE FROM soc_data WHERE ts < ?", (now - 7 * DAY,))
+    conn.commit()
+
+    profile = SocProfile()
+    seed_soc_profile(hass, profile)
+    slot, _ = slot_start(drain_start + 1800)
+    assert profile.rates[slot] < 0
@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from battery_automation.soc_history import SocHistory
+from battery_automation.soc_regression import (
+    SocRegressions,
+    StreamingLinearRegression,
+)
+
+
+def test_streaming_regression_matches_polyfit():
+    regression = StreamingLinearRegression(timedelta(hours=1))
+    timestamps = np.arange(0, 7200, 60.0)
+    socs = 90 - timestamps / 300 + np.sin(timestamps)
+    regression.load_rows(zip(timestamps, socs))
+
+    slope, intercept, origin = regression.coefficients(now=timestamps[-1])
+    kept = timestamps >= timestamps[-1] - 3600
+    expected = np.polyfit(timestamps[kept] - origin, socs[kept], 1)
+    assert (slope, intercept) == pytest.approx(tuple(expected))
+
+
+def test_charging_samples_are_left_out():
+    now = time.time()
+    history = SocHistory()
+    # Two hours draining 1% every 10 minutes
+    history.load(
+        [(now - 7200 + 600 * i, 80.0 - i) for i in range(12)], now - 8 * 24 * 3600
+    )
+    regressions = SocRegressions(history)
+    regression = regressions.register(timedelta(days=1))
+    assert len(regression) == 12
+
+    # A charge starts, its first rise is still labelled as discharging
+    for i, soc in enumerate((70.0, 72.0, 74.0, 76.0)):
+        ts = now - 600 + 100 * i
+        history.append(ts, soc)
+        regressions.add(ts, soc)
+    assert len(regression) == 13
+    slope, _, _ = regression.coefficients(now)
+    assert slope < 0
+
+
+def test_sample_stored_while_registering_is_kept():
+    now = time.time()
+    history = SocHistory()
+    history.load(
+        [(now - 7200 + 600 * i, 80.0 - i) for i in range(12)], now - 8 * 24 * 3600
+    )
+    regressions = SocRegressions(history)
+    seed = regressions._load
+
+    def seed_then_store(regression, start_ts, end_ts):
+        seeded_to = seed(regression, start_ts, end_ts)
+        if len(regression) == 12:
+            # The loop stores a sample before the regression is registered
+            history.append(now + 60, 68.0)
+            regressions.add(now + 60, 68.0)
+        return seeded_to
+
+    regressions._load = seed_then_store
+    regression = regressions.register(timedelta(days=1))
+    assert len(regression) == 13
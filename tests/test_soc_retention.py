@@ -0,0 +1,57 @@
+import sqlite3
+import time
+from datetime import timedelta
+
+from battery_automation.soc_database import get_database_path, init_database
+from battery_automation.soc_retention import SocRetentionJob, get_meta, rollup_batch
+
+T0 = 1700000000 - 1700000000 % 300
+DAY = 24 * 3600
+
+
+def open_database(hass):
+    init_database(hass)
+    return sqlite3.connect(get_database_path(hass))
+
+
+def test_rollup_totals_across_batches(hass):
+    conn = open_database(hass)
+    socs = [50.0, 49.0, 49.0, 51.0, 48.0, 47.5]
+    conn.executemany(
+        "INSERT INTO soc_data (ts, soc) VALUES (?, ?)",
+        [(T0 + 100 * i, soc) for i, soc in enumerate(socs)],
+    )
+    # Two batches, the change between them carries over through soc_meta
+    assert rollup_batch(conn, T0 + 3600, batch_size=3) == 3
+    assert rollup_batch(conn, T0 + 3600, batch_size=3) == 3
+
+    rows = conn.execute(
+        """SELECT bucket, soc_first, soc_last, increase, decrease, samples
+        FROM soc_rollup_5m ORDER BY bucket"""
+    ).fetchall()
+    assert rows == [(T0, 50.0, 49.0, 0.0, 1.0, 3), (T0 + 300, 51.0, 47.5, 2.0, 3.5, 3)]
+    hourly = conn.execute(
+        "SELECT increase, decrease, increases, decreases, samples FROM soc_rollup_1h"
+    ).fetchall()
+    assert hourly == [(2.0, 4.5, 1, 3, 6)]
+
+
+def test_retention_prunes_only_rolled_up_samples(hass):
+    conn = open_database(hass)
+    now = int(time.time())
+    conn.executemany(
+        "INSERT INTO soc_data (ts, soc) VALUES (?, ?)",
+        [(now - 10 * DAY + 3600 * i, 50.0) for i in range(10 * 24)],
+    )
+    job = SocRetentionJob(timedelta(days=7))
+    while job(conn):
+        pass
+    conn.commit()
+
+    oldest = conn.execute("SELECT MIN(ts) FROM soc_data").fetchone()[0]
+    assert oldest >= now - 7 * DAY
+    assert get_meta(conn, "pruned_before") >= now - 7 * DAY
+    # The pruned samples live on in the rollups
+    rolled = conn.execute("SELECT SUM(samples) FROM soc_rollup_1h").fetchone()[0]
+    assert rolled >= 10 * 24 - 1
+
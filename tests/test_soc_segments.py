@@ -0,0 +1,37 @@
+import numpy as np
+
+from battery_automation.soc_segments import (
+    CHARGING,
+    DISCHARGING,
+    IDLE,
+    SocSegmenter,
+    segment_soc,
+)
+
+
+def test_flat_samples_keep_the_surrounding_state():
+    falling = [60, 59, 58, 57, 56]
+    rising = [56, 57, 57, 58, 58, 59, 60, 60, 61, 62]
+    socs = falling + rising + [61, 60, 59, 58]
+    labels = segment_soc(socs).tolist()
+    # The first sample has no move before it, and a change of direction
+    # only switches the state once a second move confirms it
+    assert labels == [IDLE] + [DISCHARGING] * 7 + [CHARGING] * 8 + [DISCHARGING] * 3
+
+
+def test_single_moves_against_the_state_are_ignored():
+    labels = segment_soc([50, 49, 48, 49, 48, 47, 47, 46]).tolist()
+    assert labels == [IDLE] + [DISCHARGING] * 7
+
+
+def test_moves_within_the_deadband_are_flat():
+    labels = segment_soc([50.2, 50.4, 50.1, 50.6, 50.3]).tolist()
+    assert labels == [IDLE] * 5
+
+
+def test_segmenter_matches_segment_soc():
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        socs = np.round(50 + np.cumsum(rng.normal(0, 1.2, rng.integers(0, 60))), 1)
+        segmenter = SocSegmenter()
+        assert [segmenter.add(soc) for soc in socs] == segment_soc(socs).tolist()